@@ -0,0 +1,118 @@
+import asyncio
+import os
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from Library import engine
+
+# asyncio front end for the engine. Rendering is CPU work, so it runs on a
+# thread or process pool and a semaphore caps how many renders are in
+# flight; the event loop only ever awaits.
+
+
+class AsyncRenderer:
+    """Renders on an executor with at most concurrency renders at a time.
+
+    With processes=True the work goes to a process pool, which scales past
+    the GIL at the cost of pickling options and results. An executor can
+    also be passed in, in which case it is not shut down by close().
+    """
+
+    def __init__(self, concurrency=None, processes=False, executor=None):
+        self.concurrency = concurrency or os.cpu_count() or 1
+        self._own_executor = executor is None
+        if executor is None:
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            executor = pool(self.concurrency)
+        self.executor = executor
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def _semaphore(self):
+        # Semaphores belong to one event loop; keep one per running loop
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    async def render(self, data, options=None):
+        """Same result as engine.render, without blocking the event loop."""
+        options = engine.resolve_options(options)
+        async with self._semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(engine.render, data, options))
+
+    async def _render_item(self, item, options, return_exceptions):
+        if isinstance(item, tuple):
+            data, overrides = item
+            options = dict(options, **overrides) if overrides else options
+        else:
+            data = item
+        try:
+            return await self.render(data, options)
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return e
+
+    async def render_many(self, items, options=None, return_exceptions=False, max_in_flight=None):
+        """Render a sync or async iterable of items, yielding results in order.
+
+        items are payloads or (payload, option_overrides) tuples. At most
+        max_in_flight items (default twice the concurrency) are read ahead,
+        so a long stream never piles up in memory.
+        """
+        options = engine.resolve_options(options)
+        max_in_flight = max_in_flight or self.concurrency * 2
+        pending = deque()
+        try:
+            async for item in _aiter(items):
+                pending.append(asyncio.ensure_future(self._render_item(item, options, return_exceptions)))
+                if len(pending) >= max_in_flight:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def close(self):
+        if self._own_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+
+async def _aiter(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+_default_renderer = None
+
+
+def default_renderer():
+    global _default_renderer
+    if _default_renderer is None:
+        _default_renderer = AsyncRenderer()
+    return _default_renderer
+
+
+async def render_async(data, options=None):
+    """Render one code on the shared thread pool renderer."""
+    return await default_renderer().render(data, options)
+
+
+def render_many_async(items, options=None, return_exceptions=False):
+    """Async iterator over rendered items, in input order."""
+    return default_renderer().render_many(items, options, return_exceptions)
@@ -0,0 +1,296 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+from Library.matrix import Matrix
+
+# Caches shared by every render in this process.
+
+
+class LogoCache:
+    """LRU of decoded, resized RGBA logos with a cap on their pixel memory.
+
+    Entries are keyed on (path, mtime, file size, target px), so editing
+    the logo file on disk invalidates it automatically.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, target_px):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size, target_px)
+        with self._lock:
+            logo = self._entries.get(key)
+            if logo is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return logo
+            self.misses += 1
+
+        logo = Image.open(path).convert("RGBA")
+        logo.thumbnail((target_px, target_px), Image.LANCZOS)
+        self._store(key, logo)
+        return logo
+
+    def _store(self, key, logo):
+        size = logo.width * logo.height * 4
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = logo
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.used_bytes -= evicted.width * evicted.height * 4
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MatrixStore:
+    """Append-only file of bit-packed matrices, indexed by key digest.
+
+    Layout: a 5 byte header, then one record per matrix made of a marker
+    byte, a 16 byte blake2b digest of the key, the symbol size in modules
+    and the packed rows (size * ceil(size / 8) bytes). Records are appended
+    with a single write, so several processes can share one file; each one
+    picks up records written by the others the next time it misses.
+    """
+
+    HEADER = b"QRMX\x01"
+    MARKER = 0xA5
+
+    def __init__(self, path):
+        self.path = path
+        self._index = {}
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        if os.fstat(self._fd).st_size == 0:
+            os.write(self._fd, self.HEADER)
+        self._reader = open(path, "rb")
+        if self._reader.read(len(self.HEADER)) != self.HEADER:
+            self.close()
+            raise ValueError(f"Not a QR matrix store: {path}")
+        self._scanned = len(self.HEADER)
+        self._scan()
+
+    @staticmethod
+    def digest(key):
+        raw = "\0".join(map(str, key[:-1])).encode("utf-8") + b"\0"
+        data = key[-1]
+        raw += data if isinstance(data, bytes) else data.encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def _scan(self):
+        # Index every complete record past the point we last read to
+        self._reader.seek(self._scanned)
+        while True:
+            head = self._reader.read(18)
+            if len(head) < 18 or head[0] != self.MARKER:
+                break
+            size = head[17]
+            length = size * Matrix.stride_for(size)
+            offset = self._scanned + 18
+            self._reader.seek(length, os.SEEK_CUR)
+            if self._reader.tell() > os.fstat(self._reader.fileno()).st_size:
+                break
+            self._index[head[1:17]] = (offset, size, length)
+            self._scanned = offset + length
+
+    def get(self, key):
+        digest = self.digest(key)
+        with self._lock:
+            entry = self._index.get(digest)
+            if entry is None and os.fstat(self._reader.fileno()).st_size > self._scanned:
+                self._scan()
+                entry = self._index.get(digest)
+            if entry is None:
+                return None
+            offset, size, length = entry
+            self._reader.seek(offset)
+            return Matrix(size, self._reader.read(length))
+
+    def put(self, key, matrix):
+        digest = self.digest(key)
+        with self._lock:
+            if digest in self._index:
+                return
+            os.write(self._fd, bytes([self.MARKER]) + digest + bytes([matrix.size]) + matrix.packed)
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        os.close(self._fd)
+        self._reader.close()
+
+
+class MatrixCache:
+    """LRU of encoded matrices keyed on (encoder settings..., data).
+
+    Optionally backed by a MatrixStore so matrices survive restarts.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, store=None):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def open_store(self, path):
+        if self.store is not None and self.store.path == path:
+            return
+        if self.store is not None:
+            self.store.close()
+        self.store = MatrixStore(path)
+
+    def get(self, key):
+        with self._lock:
+            matrix = self._entries.get(key)
+            if matrix is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return matrix
+        matrix = self.store.get(key) if self.store is not None else None
+        if matrix is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._remember(key, matrix)
+        return matrix
+
+    def put(self, key, matrix):
+        self._remember(key, matrix)
+        if self.store is not None:
+            self.store.put(key, matrix)
+
+    def _remember(self, key, matrix):
+        size = len(matrix.packed)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = matrix
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.used_bytes -= len(evicted.packed)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    """LRU of finished responses (body, content type) capped by body bytes."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            response = self._entries.get(key)
+            if response is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key, body, content_type):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (body, content_type)
+            self.used_bytes += size
+            while self.used_bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.used_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.used_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Concurrent calls with the same key run once and share the result."""
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+logo_cache = LogoCache()
+matrix_cache = MatrixCache()
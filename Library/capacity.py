@@ -0,0 +1,95 @@
+from bisect import bisect_left
+
+from qrcode import util
+from qrcode.base import rs_blocks
+
+# Symbol capacity tables, so the version for a payload is looked up instead
+# of being searched for by encoding the data against growing versions.
+
+VERSIONS = range(1, 41)
+
+MODE_NUMBER = util.MODE_NUMBER
+MODE_ALPHA_NUM = util.MODE_ALPHA_NUM
+MODE_BYTE = util.MODE_8BIT_BYTE
+MODE_KANJI = util.MODE_KANJI
+
+# Versions 1-9, 10-26 and 27-40 use different character count field widths
+VERSION_CLASSES = ((1, 9), (10, 26), (27, 40))
+
+
+def _data_bits(error_correction, version):
+    return sum(block.data_count for block in rs_blocks(version, error_correction)) * 8
+
+
+# DATA_BITS[error_correction][version], index 0 unused
+DATA_BITS = {
+    error_correction: [0] + [_data_bits(error_correction, version) for version in VERSIONS]
+    for error_correction in (0, 1, 2, 3)
+}
+
+
+def payload_bits(mode, length):
+    if mode == MODE_NUMBER:
+        return 10 * (length // 3) + (0, 4, 7)[length % 3]
+    if mode == MODE_ALPHA_NUM:
+        return 11 * (length // 2) + 6 * (length % 2)
+    if mode == MODE_KANJI:
+        return 13 * length
+    return 8 * length
+
+
+def segment_bits(mode, length, version):
+    """Bits one segment takes in a symbol of the given version."""
+    return 4 + util.mode_sizes_for_version(version)[mode] + payload_bits(mode, length)
+
+
+def _max_length(mode, error_correction, version):
+    available = DATA_BITS[error_correction][version] - segment_bits(mode, 0, version)
+    length = {MODE_NUMBER: available * 3 // 10, MODE_ALPHA_NUM: available * 2 // 11,
+              MODE_KANJI: available // 13}.get(mode, available // 8)
+    while payload_bits(mode, length + 1) <= available:
+        length += 1
+    while length and payload_bits(mode, length) > available:
+        length -= 1
+    return min(length, (1 << util.mode_sizes_for_version(version)[mode]) - 1)
+
+
+# Lazily built: length -> smallest version, one byte per possible length
+_version_index = {}
+
+
+def version_index(mode, error_correction):
+    index = _version_index.get((mode, error_correction))
+    if index is None:
+        capacities = [_max_length(mode, error_correction, version) for version in VERSIONS]
+        index = bytes(bisect_left(capacities, length) + 1 for length in range(capacities[-1] + 1))
+        _version_index[(mode, error_correction)] = index
+    return index
+
+
+def max_length(mode, error_correction, version):
+    """Most characters (bytes in byte mode) of one mode a version can hold."""
+    return _max_length(mode, error_correction, version)
+
+
+def version_for(mode, error_correction, length):
+    """Smallest version holding length characters of a single mode, or None."""
+    index = version_index(mode, error_correction)
+    return index[length] if length < len(index) else None
+
+
+def fit_version(segments, error_correction, minimum=1):
+    """Smallest version >= minimum holding (mode, length) segments, or None."""
+    segments = list(segments)
+    if len(segments) == 1 and minimum == 1:
+        return version_for(segments[0][0], error_correction, segments[0][1])
+
+    limits = DATA_BITS[error_correction]
+    for first, last in VERSION_CLASSES:
+        if last < minimum:
+            continue
+        needed = sum(segment_bits(mode, length, first) for mode, length in segments)
+        version = bisect_left(limits, needed, max(first, minimum), last + 1)
+        if version <= last:
+            return version
+    return None
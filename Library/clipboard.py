@@ -0,0 +1,138 @@
+import os
+import shutil
+import struct
+import subprocess
+
+from Library import png
+
+# Copying codes to the system clipboard. build_dib makes a CF_DIB payload
+# (BITMAPINFOHEADER, palette, bottom-up rows) in one preallocated buffer,
+# with no BMP file written and sliced in between. Two-color codes become 1
+# bit DIBs. The clipboard itself is a backend: win32clipboard on Windows,
+# wl-copy/xclip on Linux, or an in-memory one for tests.
+
+BITMAPINFOHEADER = struct.Struct("<IiiHHIIiiII")
+
+# 72 dpi in pixels per metre
+PELS_PER_METER = 2835
+
+
+class ClipboardError(Exception):
+    pass
+
+
+def _stride(width, bits):
+    # DIB rows are padded to a multiple of 4 bytes
+    return (width * bits + 31) // 32 * 4
+
+
+def _dib_layout(img):
+    """(image, bits per pixel, raw mode, palette as RGB triples) for img."""
+    if img.mode == "1":
+        # PIL packs 1 bit images with 1 = white
+        return img, 1, "1", [(0, 0, 0), (255, 255, 255)]
+    if img.mode == "RGB":
+        img = png.two_color_palette(img) or img
+    if img.mode == "P":
+        palette = img.getpalette() or []
+        colors = [tuple(palette[index:index + 3]) for index in range(0, len(palette), 3)]
+        if len(colors) <= 2:
+            return img, 1, "P;1", colors
+        return img, 8, "P", colors[:256]
+    if img.mode == "L":
+        return img, 8, "L", [(value, value, value) for value in range(256)]
+    return img.convert("RGB"), 24, "BGR", []
+
+
+def build_dib(img):
+    """CF_DIB bytes for img as one bytearray.
+
+    Two-color images (mode "1", a two-entry palette or RGB with only two
+    colors) come out as 1 bit DIBs, other palette and grayscale images as
+    8 bit ones and everything else as 24 bit BGR.
+    """
+    img, bits, rawmode, palette = _dib_layout(img)
+    width, height = img.size
+    stride = _stride(width, bits)
+    offset = BITMAPINFOHEADER.size + 4 * len(palette)
+    dib = bytearray(offset + stride * height)
+
+    BITMAPINFOHEADER.pack_into(
+        dib, 0, BITMAPINFOHEADER.size, width, height, 1, bits, 0,
+        stride * height, PELS_PER_METER, PELS_PER_METER, len(palette), 0
+    )
+    for index, (red, green, blue) in enumerate(palette):
+        struct.pack_into("<4B", dib, BITMAPINFOHEADER.size + 4 * index, blue, green, red, 0)
+    # The raw encoder pads every row to the stride and writes them bottom up
+    dib[offset:] = img.tobytes("raw", (rawmode, stride, -1))
+    return dib
+
+
+class Win32Clipboard:
+    name = "win32"
+
+    def copy(self, img):
+        import win32clipboard
+        dib = build_dib(img)
+        win32clipboard.OpenClipboard()
+        try:
+            win32clipboard.EmptyClipboard()
+            win32clipboard.SetClipboardData(win32clipboard.CF_DIB, dib)
+        finally:
+            win32clipboard.CloseClipboard()
+
+
+class CommandClipboard:
+    """Pipes a PNG into a clipboard tool such as wl-copy or xclip."""
+
+    def __init__(self, command, name=None):
+        self.command = command
+        self.name = name or command[0]
+
+    def copy(self, img):
+        data = png.png_bytes(img, "fastest", metadata=False)
+        try:
+            subprocess.run(self.command, input=data, check=True, timeout=10)
+        except (OSError, subprocess.SubprocessError) as e:
+            raise ClipboardError(f"{self.name} failed: {e}") from e
+
+
+class MemoryClipboard:
+    """Keeps the last copied DIB; for tests and headless use."""
+
+    name = "memory"
+
+    def __init__(self):
+        self.data = None
+
+    def copy(self, img):
+        self.data = build_dib(img)
+
+
+def default_backend():
+    """The clipboard of this system, or None when there is none to use."""
+    if os.name == "nt":
+        return Win32Clipboard()
+    if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-copy"):
+        return CommandClipboard(["wl-copy", "--type", "image/png"])
+    if os.environ.get("DISPLAY") and shutil.which("xclip"):
+        return CommandClipboard(["xclip", "-selection", "clipboard", "-t", "image/png", "-i"])
+    return None
+
+
+_backend = None
+
+
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def copy_image(img):
+    """Put img on the clipboard with the configured or default backend."""
+    global _backend
+    if _backend is None:
+        _backend = default_backend()
+    if _backend is None:
+        raise ClipboardError("No clipboard available (install wl-copy or xclip).")
+    _backend.copy(img)
@@ -0,0 +1,164 @@
+import json
+import os
+import stat
+import tempfile
+
+# Settings file shared by the GUI, the CLI and the HTTP service. It holds
+# named style profiles and which one the GUI uses:
+#
+#   {"profile": "default",
+#    "profiles": {"default": {"fill_color": "black", ...},
+#                 "print": {"error_level": "Q", "use_logo": true, ...}}}
+#
+# A flat file from older versions (the style keys at top level) loads as
+# the "default" profile and is rewritten in this format on the next save.
+# Callers load the file once and then pick profiles by name from memory.
+
+DEFAULT_PROFILE = "default"
+
+# Keys a profile may set, with the JSON types they may have
+PROFILE_KEYS = {
+    "box_size": int,
+    "border": int,
+    "error_level": str,
+    "version": (int, type(None)),
+    "fill_color": (str, list),
+    "back_color": (str, list),
+    "use_logo": bool,
+    "logo_path": (str, type(None)),
+    "logo_position": str,
+    "logo_fit": str,
+}
+
+# What the settings window shows for keys a profile leaves out
+STYLE_DEFAULTS = {
+    "fill_color": "black",
+    "back_color": "white",
+    "error_level": "H",
+    "use_logo": False,
+    "logo_path": None,
+    "logo_position": "center",
+}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def clean_profile(name, profile):
+    """The known keys of a profile; ConfigError if one has the wrong type."""
+    if not isinstance(profile, dict):
+        raise ConfigError(f"Profile {name!r} must be an object.")
+    cleaned = {}
+    for key, types in PROFILE_KEYS.items():
+        if key not in profile:
+            continue
+        value = profile[key]
+        if not isinstance(value, types) or (isinstance(value, bool) and types is int):
+            raise ConfigError(f"Profile {name!r}: {key} has the wrong type ({type(value).__name__}).")
+        if isinstance(value, list) and not (
+            len(value) in (3, 4) and all(type(part) is int and 0 <= part <= 255 for part in value)
+        ):
+            raise ConfigError(f"Profile {name!r}: {key} must be a color name or [r, g, b] with values 0-255.")
+        cleaned[key] = value
+    return cleaned
+
+
+class Config:
+    """Profiles from one settings file, parsed and checked once.
+
+    Values are type-checked here; error levels, positions and colors are
+    checked by engine.resolve_options when a profile is first used.
+    """
+
+    def __init__(self, profiles=None, active=DEFAULT_PROFILE, path=None):
+        self.path = path
+        self.profiles = profiles if profiles is not None else {DEFAULT_PROFILE: {}}
+        self.active = active
+        # Text of the file as last read or written, to skip no-op saves
+        self._saved = None
+
+    @classmethod
+    def load(cls, path):
+        """Read path; a missing file gives an empty default profile."""
+        if not path or not os.path.isfile(path):
+            return cls(path=path)
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                raw = json.load(f)
+            except ValueError as e:
+                raise ConfigError(f"{path} is not valid JSON: {e}") from e
+        config = cls.from_dict(raw, path)
+        if "profiles" in raw:
+            # A flat file is left for the first save to convert
+            config._saved = config.dumps()
+        return config
+
+    @classmethod
+    def from_dict(cls, raw, path=None):
+        if not isinstance(raw, dict):
+            raise ConfigError("Settings must be a JSON object.")
+        if "profiles" in raw:
+            profiles = raw["profiles"]
+            if not isinstance(profiles, dict) or not profiles:
+                raise ConfigError("profiles must be an object with at least one profile.")
+            active = raw.get("profile", DEFAULT_PROFILE)
+        else:
+            profiles = {DEFAULT_PROFILE: raw}
+            active = DEFAULT_PROFILE
+        profiles = {str(name): clean_profile(name, profile) for name, profile in profiles.items()}
+        if active not in profiles:
+            raise ConfigError(f"The selected profile {active!r} is not defined.")
+        return cls(profiles, active, path)
+
+    @property
+    def names(self):
+        return sorted(self.profiles)
+
+    def profile(self, name=None):
+        """Settings of a profile, the active one by default. Do not modify."""
+        name = name or self.active
+        try:
+            return self.profiles[name]
+        except KeyError:
+            raise ConfigError(f"Unknown profile: {name!r}") from None
+
+    def set_profile(self, name, values):
+        """Create or replace a profile; unknown keys are dropped."""
+        self.profiles[name] = clean_profile(name, values)
+
+    def dumps(self):
+        return json.dumps({"profile": self.active, "profiles": self.profiles}, indent=2)
+
+    def save(self, path=None):
+        """Write the file atomically; False if nothing changed since the last load or save.
+
+        The text goes to a temporary file next to the target that then
+        replaces it, so a crash or a full disk never leaves half a file.
+        """
+        path = path or self.path
+        text = self.dumps()
+        if text == self._saved and path == self.path:
+            return False
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except OSError:
+            mode = 0o644
+        fd, temp_path = tempfile.mkstemp(prefix=".config-", suffix=".tmp", dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            # mkstemp makes the file 0600; the CLI and server may run as other users
+            os.chmod(temp_path, mode)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+        if path == self.path:
+            self._saved = text
+        return True
@@ -0,0 +1,355 @@
+import io
+import os
+
+import qrcode
+from qrcode import util
+
+from Library import capacity, layout, placement, png, raster, segments, trace, vector
+from Library.cache import logo_cache, matrix_cache
+from Library.matrix import Matrix
+
+if layout.np is not None:
+    from Library import penalty
+
+# Headless rendering engine shared by the Tk apps, the CLI and batch jobs.
+# Nothing in here may touch tkinter.
+
+ERROR_LEVELS = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H
+}
+
+VECTOR_FORMATS = ("SVG", "PDF")
+
+IMAGE_MODES = ("RGB", "P", "1", "auto")
+
+# "auto" keeps qrcode's own chunking, "optimal" finds the cheapest mix of
+# numeric/alphanumeric/byte segments, "kanji" also allows kanji mode
+SEGMENT_MODES = ("auto", "optimal", "kanji")
+
+LOGO_POSITIONS = ("center", "top-left", "top-right", "bottom-left", "bottom-right")
+
+# Fraction of the QR width the logo is scaled down to
+LOGO_SCALE = 0.2
+# Sizes logo_fit="auto" tries, largest first, before giving up
+LOGO_FIT_SCALES = (0.2, 0.18, 0.16, 0.14, 0.12, 0.1)
+
+# "off" pastes the logo as asked; "auto" keeps it off the finder patterns
+# and within the error budget by raising the error level, shrinking the
+# logo or moving it to the center
+LOGO_FITS = ("off", "auto")
+
+# Same run length threshold qrcode's add_data uses to split numeric and
+# alphanumeric runs out of a payload
+CHUNK_MINIMUM = 20
+
+# Largest side of GUI previews in pixels
+PREVIEW_PX = 200
+
+DEFAULT_OPTIONS = {
+    "box_size": 40,
+    "border": 4,
+    "error_level": "H",
+    # Pin every code to one symbol version (1-40); None picks the smallest
+    "version": None,
+    # Fixed mask pattern (0-7) for bulk jobs; None scores all eight
+    "mask": None,
+    "segments": "auto",
+    "fill_color": "black",
+    "back_color": "white",
+    "use_logo": False,
+    "logo_path": None,
+    "logo_position": "center",
+    "logo_fit": "off",
+    # Memory cap for the per-process logo cache, None keeps the current cap
+    "logo_cache_bytes": None,
+    # Path of an on-disk matrix store that persists encoded symbols
+    "matrix_store": None,
+    # "P"/"1" keep two-color codes small, "auto" picks one; logos force RGB
+    "image_mode": "RGB",
+    # None returns a PIL image, otherwise "SVG", "PDF" or a PIL format name ("PNG", "BMP", ...)
+    "format": None,
+    # PNG encoder preset ("default", "fastest", "smallest") and whether
+    # optional chunks (ICC profile) are written
+    "png_preset": "default",
+    "png_metadata": True,
+}
+
+
+class LogoError(Exception):
+    pass
+
+
+def resolve_options(options=None, **overrides):
+    """Merge options over DEFAULT_OPTIONS and validate the result."""
+    merged = dict(DEFAULT_OPTIONS)
+    if options:
+        merged.update(options)
+    merged.update(overrides)
+
+    if merged["format"]:
+        merged["format"] = merged["format"].upper()
+    if merged["image_mode"] not in IMAGE_MODES:
+        raise ValueError(f"Unknown image mode: {merged['image_mode']!r}")
+    if merged["segments"] not in SEGMENT_MODES:
+        raise ValueError(f"Unknown segment mode: {merged['segments']!r}")
+    if merged["png_preset"] not in png.PRESETS:
+        raise ValueError(f"Unknown PNG preset: {merged['png_preset']!r}")
+    if merged["logo_fit"] not in LOGO_FITS:
+        raise ValueError(f"Unknown logo fit: {merged['logo_fit']!r}")
+    if merged["error_level"] not in ERROR_LEVELS:
+        raise ValueError(f"Unknown error level: {merged['error_level']!r}")
+    try:
+        merged["box_size"] = int(merged["box_size"])
+        merged["border"] = int(merged["border"])
+    except (TypeError, ValueError):
+        raise ValueError("Box size and border must be integers.")
+    if merged["box_size"] < 1 or merged["border"] < 0:
+        raise ValueError("Box size must be positive and border non-negative.")
+    if merged["version"] is not None:
+        merged["version"] = int(merged["version"])
+        if not 1 <= merged["version"] <= 40:
+            raise ValueError(f"QR version must be between 1 and 40, not {merged['version']}.")
+    if merged["mask"] is not None:
+        merged["mask"] = int(merged["mask"])
+        if not 0 <= merged["mask"] <= 7:
+            raise ValueError(f"Mask pattern must be between 0 and 7, not {merged['mask']}.")
+    return merged
+
+
+def plan(data, options):
+    """Split data into segments and pick the version that holds them."""
+    error_correction = ERROR_LEVELS[options["error_level"]]
+    pinned = options["version"]
+    if options["segments"] == "auto":
+        chunks = list(util.optimal_data_chunks(data, minimum=CHUNK_MINIMUM))
+        # Look the version up in the capacity tables instead of fit=True's search
+        version = capacity.fit_version([(chunk.mode, len(chunk)) for chunk in chunks], error_correction, minimum=pinned or 1)
+    else:
+        # The best split depends on the count field widths, so optimize
+        # once per version class and keep the first class that fits
+        kanji = options["segments"] == "kanji"
+        version = None
+        for first, last in capacity.VERSION_CLASSES:
+            if pinned and pinned > last:
+                continue
+            chunks = segments.optimal_segments(data, max(first, pinned or 1), kanji)
+            version = capacity.fit_version([(chunk.mode, len(chunk)) for chunk in chunks], error_correction, minimum=max(first, pinned or 1))
+            if version is not None and version <= last:
+                break
+            version = None
+
+    if version is None:
+        raise ValueError(f"Data is too long for a QR code at error level {options['error_level']}.")
+    if pinned and version != pinned:
+        raise ValueError(f"Data does not fit in QR version {pinned} at error level {options['error_level']}.")
+    return chunks, version, error_correction
+
+
+def make_qr(data, options):
+    chunks, version, error_correction = plan(data, options)
+    qr = qrcode.QRCode(
+        version=version,
+        error_correction=error_correction,
+        box_size=options["box_size"],
+        border=options["border"],
+        mask_pattern=options["mask"]
+    )
+    for chunk in chunks:
+        qr.add_data(chunk)
+    qr.make(fit=False)
+    return qr
+
+
+def make_matrix(data, options):
+    if layout.np is None:
+        return Matrix.from_modules(make_qr(data, options).modules)
+
+    # Place the codewords once, then score every mask on whole arrays
+    chunks, version, error_correction = plan(data, options)
+    unmasked = layout.place_data(version, util.create_data(version, error_correction, chunks))
+    mask = options["mask"]
+    if mask is None:
+        mask = penalty.best_mask(version, unmasked)
+    modules = unmasked ^ layout.mask_patterns(version)[mask]
+    layout.set_type_info(modules, version, error_correction, mask)
+    return Matrix.from_array(modules)
+
+
+def encoder_key(options):
+    # Every option that changes the encoded symbol; styling is left out
+    return (options["error_level"], options["version"], options["mask"], options["segments"])
+
+
+def encode(data, options):
+    """Return the module matrix for data, reusing cached symbols."""
+    if options["matrix_store"]:
+        matrix_cache.open_store(options["matrix_store"])
+    key = encoder_key(options) + (data,)
+    with trace.stage("encode") as span:
+        matrix = matrix_cache.get(key)
+        cached = matrix is not None
+        if matrix is None:
+            matrix = make_matrix(data, options)
+            matrix_cache.put(key, matrix)
+        span.set(version=matrix.version, cached=cached)
+    return matrix
+
+
+def logo_box(size, logo_size, logo_position):
+    qr_width, qr_height = size
+    logo_width, logo_height = logo_size
+    positions = {
+        "center": ((qr_width - logo_width) // 2, (qr_height - logo_height) // 2),
+        "top-left": (0, 0),
+        "top-right": (qr_width - logo_width, 0),
+        "bottom-left": (0, qr_height - logo_height),
+        "bottom-right": (qr_width - logo_width, qr_height - logo_height),
+    }
+    return positions.get(logo_position, positions["center"])
+
+
+def place_logo(qr_size, logo_path, logo_position="center", scale=LOGO_SCALE):
+    """Return the resized logo and where its top left corner goes."""
+    try:
+        logo = logo_cache.get(logo_path, int(qr_size[0] * scale))
+    except Exception as e:
+        raise LogoError(str(e)) from e
+    return logo, logo_box(qr_size, logo.size, logo_position)
+
+
+def fit_logo(data, options):
+    """(options, matrix, logo) with a logo placement that keeps the code readable.
+
+    Tries the requested size first, at the requested error level and then
+    each higher one, at the requested position and then the center; only
+    when none of those fit does it shrink the logo, through LOGO_FIT_SCALES.
+    Raises LogoError when even that does not fit.
+    """
+    positions = [options["logo_position"]] + (["center"] if options["logo_position"] != "center" else [])
+    levels = list(ERROR_LEVELS)[list(ERROR_LEVELS).index(options["error_level"]):]
+    for scale in LOGO_FIT_SCALES:
+        for level in levels:
+            candidate = dict(options, error_level=level) if level != options["error_level"] else options
+            try:
+                matrix = encode(data, candidate)
+            except ValueError:
+                if candidate is options:
+                    raise
+                # Higher levels may not fit a pinned version
+                continue
+            qr_px = (matrix.size + 2 * options["border"]) * options["box_size"]
+            for position in positions:
+                logo = place_logo((qr_px, qr_px), options["logo_path"], position, scale)
+                (x, y), (width, height) = logo[1], logo[0].size
+                rows, cols = placement.module_span((x, y, width, height), options)
+                if placement.logo_fits(matrix.version, ERROR_LEVELS[level], options["border"], rows, cols):
+                    return candidate, matrix, logo
+    raise LogoError("There is no place for the logo that keeps the code readable; use a smaller logo or none.")
+
+
+def encode_image(img, fmt, options=None):
+    with trace.stage("save", format=fmt) as span:
+        output = io.BytesIO()
+        if fmt == "PNG" and options is not None:
+            # image_mode already decided the pixel format, keep it
+            png.save_png(img, output, options["png_preset"], "keep", options["png_metadata"])
+        else:
+            img.save(output, fmt)
+        span.set(bytes=output.tell())
+        return output.getvalue()
+
+
+def render(data, options=None, on_logo_error=None, info=None):
+    """Render one QR code.
+
+    Returns a PIL image, or encoded bytes when options["format"] is set.
+    A failing logo raises LogoError unless on_logo_error is given, in which
+    case it is called with the error and the code is returned without logo.
+    If info is a dict it is filled with the "version" and "error_level"
+    the code was made with, which logo_fit="auto" may have raised.
+    """
+    options = resolve_options(options)
+    if not data:
+        raise ValueError("Nothing to encode.")
+    with trace.stage("render", chars=len(data), format=options["format"]):
+        return _render(data, options, on_logo_error, info)
+
+
+def _render(data, options, on_logo_error, info=None):
+    matrix = None
+    logo = None
+    logo_path = options["logo_path"]
+    if options["use_logo"] and logo_path and os.path.isfile(logo_path):
+        if options["logo_cache_bytes"] is not None:
+            logo_cache.max_bytes = options["logo_cache_bytes"]
+        try:
+            # The budget check needs numpy; without it the logo goes where asked
+            if options["logo_fit"] == "auto" and layout.np is not None:
+                with trace.stage("logo_fit") as span:
+                    options, matrix, logo = fit_logo(data, options)
+                    span.set(error_level=options["error_level"], width=logo[0].width, position=logo[1])
+            else:
+                matrix = encode(data, options)
+                qr_px = (matrix.size + 2 * options["border"]) * options["box_size"]
+                with trace.stage("logo", px=qr_px):
+                    logo = place_logo((qr_px, qr_px), logo_path, options["logo_position"])
+        except LogoError as e:
+            if on_logo_error is None:
+                raise
+            on_logo_error(e)
+    if matrix is None:
+        matrix = encode(data, options)
+    if info is not None:
+        info["version"] = matrix.version
+        info["error_level"] = options["error_level"]
+
+    if options["format"] in VECTOR_FORMATS:
+        with trace.stage(options["format"].lower()) as span:
+            write = vector.svg_bytes if options["format"] == "SVG" else vector.pdf_bytes
+            output = write(matrix, options, logo)
+            span.set(bytes=len(output))
+            return output
+
+    with trace.stage("rasterize") as span:
+        qr_img = raster.rasterize(matrix, options, "RGB" if logo else options["image_mode"])
+        span.set(width=qr_img.width, height=qr_img.height, mode=qr_img.mode)
+    if logo:
+        logo_img, position = logo
+        with trace.stage("logo_paste", width=logo_img.width, height=logo_img.height):
+            qr_img.paste(logo_img, position, logo_img)
+
+    if options["format"]:
+        return encode_image(qr_img, options["format"], options)
+    return qr_img
+
+
+def render_preview(data, options=None, on_logo_error=None, max_px=PREVIEW_PX):
+    """Render at thumbnail size straight from the matrix.
+
+    The box size is the largest whole number of pixels per module that fits
+    in max_px, so no full-size image is ever made just to be shrunk.
+    """
+    options = resolve_options(options, format=None)
+    if not data:
+        raise ValueError("Nothing to encode.")
+    with trace.stage("preview", max_px=max_px):
+        units = encode(data, options).size + 2 * options["border"]
+        while True:
+            box_size = max(1, min(options["box_size"], max_px // units))
+            info = {}
+            preview = render(data, dict(options, box_size=box_size), on_logo_error, info)
+            # logo_fit="auto" may have moved to a larger version; size again for that one
+            fitted = layout.size_for(info["version"]) + 2 * options["border"]
+            if fitted <= units or box_size <= max(1, max_px // fitted):
+                return preview
+            units = fitted
+
+
+def render_many(items, options=None, on_logo_error=None):
+    """Lazily render every payload in items with the same options."""
+    options = resolve_options(options)
+    for data in items:
+        yield render(data, options, on_logo_error)
@@ -0,0 +1,208 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image, ImageDraw, ImageFont
+
+from Library import engine, layout, raster
+
+# Print sheets: codes tiled onto A4, letter or label stock pages. Every code
+# is pasted from a cached module bitmap through a mask, and each page is
+# handed out as soon as its last cell is filled, so a run of any length only
+# ever holds one page in memory.
+
+MM_PER_INCH = 25.4
+
+PAGE_SIZES = {
+    "A4": (210.0, 297.0),
+    "letter": (215.9, 279.4),
+}
+
+# Label stock: page, columns, rows, label size, first label's top left
+# corner and label pitch, all in mm
+LABEL_STOCK = {
+    "L7160": ("A4", 3, 7, (63.5, 38.1), (7.2, 15.1), (66.0, 38.1)),
+    "L7163": ("A4", 2, 7, (99.1, 38.1), (4.7, 15.1), (101.6, 38.1)),
+    "L7651": ("A4", 5, 13, (38.1, 21.2), (4.7, 10.7), (40.6, 21.2)),
+    "5160": ("letter", 3, 10, (66.7, 25.4), (4.8, 12.7), (69.9, 25.4)),
+}
+
+SHEETS = tuple(PAGE_SIZES) + tuple(LABEL_STOCK)
+
+# Space kept inside every cell so codes do not touch the cut lines
+CELL_PADDING_MM = 1.5
+
+# Sheet geometry in pixels: page size and one (x, y, width, height) per cell
+Sheet = namedtuple("Sheet", ("size", "cells", "dpi"))
+
+
+def _px(mm, dpi):
+    return int(round(mm * dpi / MM_PER_INCH))
+
+
+def sheet_layout(name="A4", dpi=300, columns=4, rows=6, margin_mm=10.0, gap_mm=5.0):
+    """Cells of one page. columns/rows/margins only apply to plain pages."""
+    if name in LABEL_STOCK:
+        page, columns, rows, (label_w, label_h), (left, top), (pitch_x, pitch_y) = LABEL_STOCK[name]
+    elif name in PAGE_SIZES:
+        page = name
+        width, height = PAGE_SIZES[name]
+        label_w = (width - 2 * margin_mm - (columns - 1) * gap_mm) / columns
+        label_h = (height - 2 * margin_mm - (rows - 1) * gap_mm) / rows
+        if label_w <= 0 or label_h <= 0:
+            raise ValueError(f"{columns}x{rows} cells do not fit on {name} with these margins.")
+        left = top = margin_mm
+        pitch_x, pitch_y = label_w + gap_mm, label_h + gap_mm
+    else:
+        raise ValueError(f"Unknown sheet: {name!r}")
+
+    width, height = PAGE_SIZES[page]
+    pad = CELL_PADDING_MM
+    cells = tuple(
+        (
+            _px(left + column * pitch_x + pad, dpi),
+            _px(top + row * pitch_y + pad, dpi),
+            _px(label_w - 2 * pad, dpi),
+            _px(label_h - 2 * pad, dpi),
+        )
+        for row in range(rows)
+        for column in range(columns)
+    )
+    return Sheet((_px(width, dpi), _px(height, dpi)), cells, dpi)
+
+
+@lru_cache(maxsize=256)
+def module_bitmap(matrix, box_size):
+    """Mode "1" mask of the dark modules at box_size, shared by repeated codes."""
+    size = matrix.size * box_size
+    return matrix.to_image().resize((size, size), Image.NEAREST)
+
+
+@lru_cache(maxsize=8)
+def caption_font(size):
+    return ImageFont.load_default(size=size)
+
+
+def fit_caption(draw, text, font, width):
+    # Cut long payloads down so the caption stays inside its cell
+    text = str(text)[:200]
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "...", font=font) > width:
+        text = text[:-1]
+    return text + "..."
+
+
+def page_mode(options):
+    # Bilevel pages are 1 bit per pixel, anything colored needs RGB
+    logo = options["use_logo"] and options["logo_path"]
+    return "1" if raster.is_black_on_white(options) and not logo else "RGB"
+
+
+def new_page(sheet, options):
+    return Image.new(page_mode(options), sheet.size, "white")
+
+
+def cell_box_size(cell, size, options, caption_px=0):
+    """Largest box size up to options["box_size"] for a size-module code in cell."""
+    _, _, width, height = cell
+    units = size + 2 * options["border"]
+    box_size = min(options["box_size"], width // units, (height - caption_px) // units)
+    if box_size < 1:
+        raise ValueError(f"A {units} module code does not fit in a {width}x{height} px cell.")
+    return box_size
+
+
+def fit_in_cell(data, options, cell, caption_px=0):
+    """engine.fit_logo at the box size the cell allows: (options, matrix, logo)."""
+    size = engine.encode(data, options).size
+    while True:
+        box_size = cell_box_size(cell, size, options, caption_px)
+        fitted, matrix, logo = engine.fit_logo(data, dict(options, box_size=box_size))
+        # A larger fitted version may need a smaller box to stay in the cell
+        if matrix.size <= size or cell_box_size(cell, matrix.size, options, caption_px) >= box_size:
+            return fitted, matrix, logo
+        size = matrix.size
+
+
+def draw_code(page, cell, matrix, options, caption=None, caption_px=0, logo=None):
+    """Paste one code centred in cell, with an optional caption underneath.
+
+    logo is a (logo image, position) pair from fit_in_cell; without one the
+    logo of options is placed as asked.
+    """
+    x, y, width, height = cell
+    caption_px = caption_px if caption else 0
+    box_size = cell_box_size(cell, matrix.size, options, caption_px)
+    code_px = (matrix.size + 2 * options["border"]) * box_size
+    if logo is None and options["use_logo"] and options["logo_path"] and page.mode != "1":
+        logo = engine.place_logo((code_px, code_px), options["logo_path"], options["logo_position"])
+
+    left = x + (width - code_px) // 2
+    top = y + (height - caption_px - code_px) // 2
+    fill = raster.to_rgb(options["fill_color"])
+    back = raster.to_rgb(options["back_color"])
+    if page.mode == "1":
+        fill, back = 0, 1
+    if back != (255, 255, 255):
+        page.paste(back, (left, top, left + code_px, top + code_px))
+    quiet = options["border"] * box_size
+    page.paste(fill, (left + quiet, top + quiet), module_bitmap(matrix, box_size))
+
+    if logo:
+        logo_img, (logo_x, logo_y) = logo
+        page.paste(logo_img, (left + logo_x, top + logo_y), logo_img)
+
+    if caption:
+        draw = ImageDraw.Draw(page)
+        font = caption_font(max(6, int(caption_px / 1.3)))
+        text = fit_caption(draw, caption, font, width)
+        draw.text((x + width // 2, top + code_px + caption_px // 6), text, fill=fill, font=font, anchor="mt")
+
+
+def impose(items, options=None, sheet=None, captions=False, caption_pt=8, on_error=None):
+    """Lay codes out on pages, yielding each page image as soon as it is full.
+
+    items are payloads or (payload, caption) or (payload, caption,
+    overrides) tuples; without a caption the payload itself is printed when
+    captions is set, and overrides are options for that code only. Codes
+    keep their box_size and border and are only scaled down to fit their
+    cell. A bilevel page turns RGB when a code on it needs color. If
+    on_error is given it is called with (item, error) for a payload that
+    cannot be placed and its cell is left for the next one.
+    """
+    options = engine.resolve_options(options)
+    sheet = sheet or sheet_layout()
+    # Caption line height in pixels at the sheet's resolution
+    caption_px = int(caption_pt / 72 * sheet.dpi * 1.3)
+    page = None
+    slot = 0
+    for item in items:
+        data, caption, overrides = (item + (None, None))[:3] if isinstance(item, tuple) else (item, None, None)
+        if page is None:
+            page = new_page(sheet, options)
+        try:
+            if not data:
+                raise ValueError("Nothing to encode.")
+            code_options = engine.resolve_options(options, **overrides) if overrides else options
+            if page.mode == "1" and page_mode(code_options) == "RGB":
+                page = page.convert("RGB")
+            caption = (caption or data) if captions else None
+            logo = None
+            if code_options["use_logo"] and code_options["logo_path"] and code_options["logo_fit"] == "auto" and layout.np is not None:
+                code_options, matrix, logo = fit_in_cell(data, code_options, sheet.cells[slot], caption_px if caption else 0)
+            else:
+                matrix = engine.encode(data, code_options)
+            draw_code(page, sheet.cells[slot], matrix, code_options, caption, caption_px, logo)
+        except (ValueError, engine.LogoError) as e:
+            if on_error is None:
+                raise
+            on_error(item, e)
+            continue
+        slot += 1
+        if slot == len(sheet.cells):
+            yield page
+            page = None
+            slot = 0
+    # Rows that failed after the last full page leave nothing to print
+    if slot:
+        yield page
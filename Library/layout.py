@@ -0,0 +1,177 @@
+from functools import lru_cache
+
+from qrcode import base, util
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Symbol geometry per version as numpy arrays: function patterns, where the
+# data bits go, the eight mask patterns and the format/version info cells.
+# Everything is derived once per version and cached; it mirrors the module
+# placement of qrcode's makeImpl exactly.
+
+
+def size_for(version):
+    return version * 4 + 17
+
+
+@lru_cache(maxsize=None)
+def function_template(version):
+    """(reserved, dark) boolean arrays for the fixed patterns of a version.
+
+    reserved marks every module that is not a data module, including the
+    format and version info areas; dark holds the finder, alignment and
+    timing patterns, with format and version info left light.
+    """
+    n = size_for(version)
+    reserved = np.zeros((n, n), dtype=bool)
+    dark = np.zeros((n, n), dtype=bool)
+
+    finder = np.zeros((7, 7), dtype=bool)
+    finder[[0, 6], :] = finder[:, [0, 6]] = True
+    finder[2:5, 2:5] = True
+    for row, col in ((0, 0), (n - 7, 0), (0, n - 7)):
+        # Finder plus its light separator, clipped to the symbol
+        reserved[max(row - 1, 0):row + 8, max(col - 1, 0):col + 8] = True
+        dark[row:row + 7, col:col + 7] = finder
+
+    alignment = np.ones((5, 5), dtype=bool)
+    alignment[1:4, 1:4] = False
+    alignment[2, 2] = True
+    positions = util.pattern_position(version)
+    for row in positions:
+        for col in positions:
+            if reserved[row, col]:
+                continue
+            reserved[row - 2:row + 3, col - 2:col + 3] = True
+            dark[row - 2:row + 3, col - 2:col + 3] = alignment
+
+    timing = np.arange(8, n - 8)
+    free = ~reserved[timing, 6]
+    reserved[timing[free], 6] = True
+    dark[timing[free], 6] = timing[free] % 2 == 0
+    free = ~reserved[6, timing]
+    reserved[6, timing[free]] = True
+    dark[6, timing[free]] = timing[free] % 2 == 0
+
+    for row, col in format_cells(version):
+        reserved[row, col] = True
+    reserved[n - 8, 8] = True
+    if version >= 7:
+        for row, col in version_cells(version):
+            reserved[row, col] = True
+
+    reserved.setflags(write=False)
+    dark.setflags(write=False)
+    return reserved, dark
+
+
+def format_cells(version):
+    # Both copies of the 15 format bits, in bit order (bit 0 first)
+    n = size_for(version)
+    vertical = [(i, 8) if i < 6 else (i + 1, 8) if i < 8 else (n - 15 + i, 8) for i in range(15)]
+    horizontal = [(8, n - i - 1) if i < 8 else (8, 15 - i) if i < 9 else (8, 15 - i - 1) for i in range(15)]
+    return vertical + horizontal
+
+
+def version_cells(version):
+    # Both copies of the 18 version bits (versions 7+), in bit order
+    n = size_for(version)
+    first = [(i // 3, i % 3 + n - 11) for i in range(18)]
+    second = [(i % 3 + n - 11, i // 3) for i in range(18)]
+    return first + second
+
+
+@lru_cache(maxsize=None)
+def data_order(version):
+    """(rows, cols) of the data modules in the order bits are placed."""
+    n = size_for(version)
+    reserved, _ = function_template(version)
+    rows, cols = [], []
+    upward = True
+    for col in range(n - 1, 0, -2):
+        if col <= 6:
+            col -= 1
+        row_range = range(n - 1, -1, -1) if upward else range(n)
+        for row in row_range:
+            for c in (col, col - 1):
+                if not reserved[row, c]:
+                    rows.append(row)
+                    cols.append(c)
+        upward = not upward
+    order = np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+    for array in order:
+        array.setflags(write=False)
+    return order
+
+
+@lru_cache(maxsize=None)
+def block_layout(version, error_correction):
+    """[(stream indices, data count)] per Reed-Solomon block.
+
+    The indices say where each codeword of the block sits in the
+    interleaved codeword stream, data codewords first.
+    """
+    blocks = base.rs_blocks(version, error_correction)
+    data_total = sum(block.data_count for block in blocks)
+    data_index = [[] for _ in blocks]
+    ec_index = [[] for _ in blocks]
+    position = 0
+    for i in range(max(block.data_count for block in blocks)):
+        for number, block in enumerate(blocks):
+            if i < block.data_count:
+                data_index[number].append(position)
+                position += 1
+    position = data_total
+    for i in range(max(block.total_count - block.data_count for block in blocks)):
+        for number, block in enumerate(blocks):
+            if i < block.total_count - block.data_count:
+                ec_index[number].append(position)
+                position += 1
+    return [(np.array(data_index[n] + ec_index[n], dtype=np.intp), block.data_count) for n, block in enumerate(blocks)]
+
+
+@lru_cache(maxsize=None)
+def mask_patterns(version):
+    """(8, n, n) array: where each mask pattern flips a data module."""
+    n = size_for(version)
+    i, j = np.indices((n, n))
+    masks = np.stack([
+        (i + j) % 2 == 0,
+        i % 2 == 0,
+        j % 3 == 0,
+        (i + j) % 3 == 0,
+        (i // 2 + j // 3) % 2 == 0,
+        (i * j) % 2 + (i * j) % 3 == 0,
+        ((i * j) % 2 + (i * j) % 3) % 2 == 0,
+        ((i * j) % 3 + (i + j) % 2) % 2 == 0,
+    ])
+    masks &= ~function_template(version)[0]
+    masks.setflags(write=False)
+    return masks
+
+
+def place_data(version, codewords):
+    """Unmasked symbol: fixed patterns plus the codeword bits."""
+    reserved, dark = function_template(version)
+    modules = dark.copy()
+    rows, cols = data_order(version)
+    bits = np.unpackbits(np.frombuffer(bytes(codewords), dtype=np.uint8)).astype(bool)
+    count = min(len(bits), len(rows))
+    modules[rows[:count], cols[:count]] = bits[:count]
+    return modules
+
+
+def set_type_info(modules, version, error_correction, mask):
+    """Write the format (and for v7+ version) bits into modules in place."""
+    bits = util.BCH_type_info((error_correction << 3) | mask)
+    for i, (row, col) in enumerate(format_cells(version)):
+        modules[row, col] = bits >> (i % 15) & 1
+    modules[size_for(version) - 8, 8] = True
+    if version >= 7:
+        bits = util.BCH_type_number(version)
+        for i, (row, col) in enumerate(version_cells(version)):
+            modules[row, col] = bits >> (i % 18) & 1
+    return modules
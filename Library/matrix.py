@@ -0,0 +1,59 @@
+from PIL import Image
+
+# Encoded QR symbol, stored bit-packed. Rows are packed MSB first and padded
+# to whole bytes, which is exactly PIL's raw layout for mode "1" images.
+
+
+class Matrix:
+    __slots__ = ("size", "packed")
+
+    def __init__(self, size, packed):
+        self.size = size
+        self.packed = packed
+
+    @classmethod
+    def from_modules(cls, modules):
+        size = len(modules)
+        pad = cls.stride_for(size) * 8 - size
+        packed = bytearray()
+        for row in modules:
+            value = 0
+            for module in row:
+                value = value << 1 | bool(module)
+            packed += (value << pad).to_bytes(cls.stride_for(size), "big")
+        return cls(size, bytes(packed))
+
+    @classmethod
+    def from_array(cls, modules):
+        # Boolean numpy array, packed without a Python loop
+        import numpy as np
+        return cls(len(modules), np.packbits(modules, axis=1).tobytes())
+
+    @staticmethod
+    def stride_for(size):
+        return (size + 7) // 8
+
+    @property
+    def stride(self):
+        return self.stride_for(self.size)
+
+    @property
+    def version(self):
+        return (self.size - 17) // 4
+
+    def rows(self):
+        stride = self.stride
+        pad = stride * 8 - self.size
+        for offset in range(0, len(self.packed), stride):
+            value = int.from_bytes(self.packed[offset:offset + stride], "big") >> pad
+            yield [bool(value >> shift & 1) for shift in range(self.size - 1, -1, -1)]
+
+    def to_image(self):
+        # Dark modules come out as 255, ready to be used as a paste mask
+        return Image.frombytes("1", (self.size, self.size), self.packed)
+
+    def __eq__(self, other):
+        return isinstance(other, Matrix) and self.size == other.size and self.packed == other.packed
+
+    def __hash__(self):
+        return hash((self.size, self.packed))
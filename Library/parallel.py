@@ -0,0 +1,125 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from Library import engine
+
+# Multi-process batch rendering. Items are sent to the pool in chunks, at
+# most max_in_flight chunks are outstanding at any time, and results are
+# yielded in input order.
+
+_worker_options = None
+# Fraction of modules to damage when verifying, None when not verifying
+_worker_verify = None
+# Whether results carry the render info dict
+_worker_info = False
+
+
+def _init_worker(options, verify=None, info=False):
+    global _worker_options, _worker_verify, _worker_info
+    _worker_options = options
+    _worker_verify = verify
+    _worker_info = info or verify is not None
+
+
+def _render_one(item, options, return_exceptions):
+    if isinstance(item, tuple):
+        data, overrides = item
+        options = dict(options, **overrides) if overrides else options
+    else:
+        data = item
+    try:
+        if not _worker_info:
+            return engine.render(data, options)
+        info = {}
+        output = engine.render(data, options, info=info)
+        if _worker_verify is not None:
+            from Library import verify
+            info["verification"] = verify.verify_output(output, data, engine.resolve_options(options), _worker_verify)
+        return output, info
+    except Exception as e:
+        if not return_exceptions:
+            raise
+        return e
+
+
+def _render_chunk(chunk, return_exceptions):
+    start = time.perf_counter()
+    results = [_render_one(item, _worker_options, return_exceptions) for item in chunk]
+    return os.getpid(), time.perf_counter() - start, results
+
+
+def _chunks(items, chunk_size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _record(stats, pid, seconds, count):
+    if stats is None:
+        return
+    worker = stats.setdefault(pid, {"codes": 0, "seconds": 0.0})
+    worker["codes"] += count
+    worker["seconds"] += seconds
+
+
+def render_parallel(items, options=None, workers=None, max_in_flight=None, chunk_size=16,
+                    return_exceptions=False, stats=None, verify=None, info=False):
+    """Render items across a process pool, yielding results in input order.
+
+    items are payloads or (payload, option_overrides) tuples. workers
+    defaults to every core; workers=1 renders in this process. If stats is
+    a dict it is filled with {pid: {"codes": n, "seconds": busy_time}}.
+    With return_exceptions a failed item yields its exception instead of
+    aborting the batch. With info every result is an (output, info)
+    pair, info being what engine.render filled in (the version and error
+    level actually used). verify (a fraction of modules to damage first, 0
+    for none) implies info and adds a "verification" entry, checked in
+    the worker that rendered it.
+    """
+    options = engine.resolve_options(options)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(options, verify, info)
+        for chunk in _chunks(items, chunk_size):
+            pid, seconds, results = _render_chunk(chunk, return_exceptions)
+            _record(stats, pid, seconds, len(results))
+            yield from results
+        return
+
+    max_in_flight = max_in_flight or workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(options, verify, info)) as pool:
+        try:
+            for chunk in _chunks(items, chunk_size):
+                pending.append(pool.submit(_render_chunk, chunk, return_exceptions))
+                # Backpressure: wait for the oldest chunk before reading more input
+                while len(pending) >= max_in_flight:
+                    pid, seconds, results = pending.popleft().result()
+                    _record(stats, pid, seconds, len(results))
+                    yield from results
+            while pending:
+                pid, seconds, results = pending.popleft().result()
+                _record(stats, pid, seconds, len(results))
+                yield from results
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def format_stats(stats, elapsed=None):
+    lines = []
+    for number, (pid, worker) in enumerate(sorted(stats.items()), 1):
+        rate = worker["codes"] / worker["seconds"] if worker["seconds"] else 0.0
+        lines.append(f"worker {number} (pid {pid}): {worker['codes']} codes in {worker['seconds']:.2f}s, {rate:.1f} codes/s")
+    if elapsed:
+        total = sum(worker["codes"] for worker in stats.values())
+        lines.append(f"total: {total} codes in {elapsed:.2f}s, {total / elapsed:.1f} codes/s")
+    return "\n".join(lines)
@@ -0,0 +1,66 @@
+import numpy as np
+
+from Library import layout
+
+# Vectorized QR mask penalty (the four rules of ISO/IEC 18004 7.8.3). Each
+# rule is evaluated with whole-array operations instead of per-module loops.
+# Scores and tie-breaking match qrcode's pure Python util.lost_point.
+
+# Rule 3 patterns as 11 bit integers: 1:1:3:1:1 with 4 light modules after/before
+FINDER_LIKE = (0b10111010000, 0b00001011101)
+
+
+def _long_runs(lines):
+    # Rule 1: every run of 5+ equal modules costs (length - 2)
+    count, length = lines.shape
+    edges = np.ones((count, length + 1), dtype=bool)
+    edges[:, 1:-1] = lines[:, 1:] != lines[:, :-1]
+    starts = np.flatnonzero(edges.ravel())
+    runs = np.diff(starts)
+    # A diff that crosses from one line's end to the next line's start is 1
+    runs = runs[runs >= 5]
+    return int(runs.sum() - 2 * len(runs))
+
+
+def _finder_like(lines):
+    # Every 11 module window of every line packed into one integer
+    bits = lines.astype(np.int32)
+    width = bits.shape[1] - 10
+    windows = bits[:, :width] << 10
+    for offset in range(1, 11):
+        windows |= bits[:, offset:offset + width] << (10 - offset)
+    return int(((windows == FINDER_LIKE[0]) | (windows == FINDER_LIKE[1])).sum())
+
+
+def penalty(modules):
+    """Penalty score of one (n, n) boolean symbol."""
+    return int(penalties(modules[None])[0])
+
+
+def penalties(candidates):
+    """Penalty score of each symbol in a (k, n, n) boolean stack."""
+    count, n, _ = candidates.shape
+    scores = np.zeros(count, dtype=np.int64)
+    for index, modules in enumerate(candidates):
+        score = _long_runs(modules) + _long_runs(modules.T)
+
+        same = modules[:-1, :-1]
+        blocks = (same == modules[1:, :-1]) & (same == modules[:-1, 1:]) & (same == modules[1:, 1:])
+        score += 3 * int(blocks.sum())
+
+        score += 40 * (_finder_like(modules) + _finder_like(modules.T))
+
+        percent = float(modules.sum()) / (n ** 2)
+        score += int(abs(percent * 100 - 50) / 5) * 10
+        scores[index] = score
+    return scores
+
+
+def best_mask(version, unmasked):
+    """Mask pattern with the lowest penalty for an unmasked symbol.
+
+    Candidates are scored with format and version info left light, as
+    qrcode does, and ties go to the lowest pattern number.
+    """
+    candidates = unmasked[None] ^ layout.mask_patterns(version)
+    return int(np.argmin(penalties(candidates)))
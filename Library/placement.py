@@ -0,0 +1,101 @@
+import math
+from functools import lru_cache
+
+from Library import layout
+
+np = layout.np
+
+# Logo error budget. A logo pasted over a code destroys every codeword with
+# a module under it, and each Reed-Solomon block can only correct half its
+# error correction codewords. With a per-version map from module to
+# codeword and from codeword to block, the damage of a logo box is a slice,
+# a unique and a bincount, so every code in a batch can be checked.
+#
+# Modules count as destroyed when the logo box touches them at all, even
+# where the logo is transparent or happens to match, so the estimate errs
+# on the safe side.
+
+# Share of every block's correction capacity kept free for print defects,
+# scuffs and glare once the logo is on
+LOGO_RESERVE = 0.25
+
+
+@lru_cache(maxsize=None)
+def codeword_map(version):
+    """(n, n) array: interleaved codeword index of each module, -1 if none."""
+    n = layout.size_for(version)
+    rows, cols = layout.data_order(version)
+    codewords = np.full((n, n), -1, dtype=np.int32)
+    # Modules past the last whole codeword are remainder bits
+    count = len(rows) // 8 * 8
+    codewords[rows[:count], cols[:count]] = np.arange(count) // 8
+    codewords.setflags(write=False)
+    return codewords
+
+
+@lru_cache(maxsize=None)
+def block_budget(version, error_correction):
+    """(block of each stream codeword, codewords each block may lose)."""
+    blocks = layout.block_layout(version, error_correction)
+    owner = np.empty(sum(len(indices) for indices, _ in blocks), dtype=np.intp)
+    budget = np.empty(len(blocks), dtype=np.intp)
+    for number, (indices, data_count) in enumerate(blocks):
+        owner[indices] = number
+        capacity = (len(indices) - data_count) // 2
+        budget[number] = capacity - math.ceil(capacity * LOGO_RESERVE)
+    owner.setflags(write=False)
+    budget.setflags(write=False)
+    return owner, budget
+
+
+def module_span(box, options):
+    """(row slice, col slice) of the modules a pixel box (x, y, w, h) touches.
+
+    Coordinates are in modules of the symbol, so the quiet zone is
+    negative or >= size; the slices are not clipped.
+    """
+    x, y, width, height = box
+    box_size, offset = options["box_size"], options["border"] * options["box_size"]
+    cols = slice((x - offset) // box_size, -(-(x + width - offset) // box_size))
+    rows = slice((y - offset) // box_size, -(-(y + height - offset) // box_size))
+    return rows, cols
+
+
+@lru_cache(maxsize=None)
+def keep_out(version, border):
+    """Module rectangles (top, left, bottom, right) a logo must not touch.
+
+    The three finder patterns with their separators, the format and
+    version information next to them and the quiet zone around them:
+    scanners cannot find or read a code without those.
+    """
+    n = layout.size_for(version)
+    # Version information sits beside the top right and bottom left finders
+    extra = 3 if version >= 7 else 0
+    return (
+        (-border, -border, 9, 9),
+        (-border, n - 8 - extra, 9, n + border),
+        (n - 8 - extra, -border, n + border, 9),
+    )
+
+
+def _overlaps(rows, cols, rect):
+    top, left, bottom, right = rect
+    return rows.start < bottom and top < rows.stop and cols.start < right and left < cols.stop
+
+
+def logo_damage(version, error_correction, rows, cols):
+    """Codewords destroyed per block by a logo over rows x cols."""
+    n = layout.size_for(version)
+    covered = codeword_map(version)[max(rows.start, 0):min(rows.stop, n), max(cols.start, 0):min(cols.stop, n)]
+    codewords = np.unique(covered[covered >= 0])
+    owner, budget = block_budget(version, error_correction)
+    return np.bincount(owner[codewords], minlength=len(budget))
+
+
+def logo_fits(version, error_correction, border, rows, cols):
+    """True if a logo over rows x cols leaves the code readable with margin."""
+    if any(_overlaps(rows, cols, rect) for rect in keep_out(version, border)):
+        return False
+    _, budget = block_budget(version, error_correction)
+    return bool((logo_damage(version, error_correction, rows, cols) <= budget).all())
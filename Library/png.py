@@ -0,0 +1,67 @@
+import io
+
+# PNG export. QR codes are large flat areas of one or two colors, so the
+# encoder settings matter more than for photos: zlib's run-length strategy
+# is as small as the default at a fraction of the time, and two-color
+# images are written as 1 bit palette PNGs instead of 24 bit RGB.
+
+# Z_RLE from zlib, passed through Pillow's compress_type
+Z_RLE = 3
+
+PRESETS = {
+    # Pillow's own defaults (zlib level 6)
+    "default": {},
+    "fastest": {"compress_level": 1, "compress_type": Z_RLE},
+    "smallest": {"compress_level": 9, "optimize": True},
+}
+
+
+def two_color_palette(img):
+    """Two-entry "P" version of an RGB image with at most two colors, else None."""
+    if img.mode != "RGB":
+        return None
+    colors = img.getcolors(2)
+    if colors is None:
+        return None
+    if len(colors) == 1:
+        (_, color), = colors
+        indexed = img.getchannel(0).point(lambda value: 0).convert("P")
+        indexed.putpalette(color)
+        return indexed
+    (_, first), (_, second) = colors
+    # One channel where the colors differ is enough to tell every pixel apart
+    channel = next(index for index in range(3) if first[index] != second[index])
+    table = [1 if value == second[channel] else 0 for value in range(256)]
+    indexed = img.getchannel(channel).point(table).convert("P")
+    indexed.putpalette(first + second)
+    return indexed
+
+
+def save_png(img, fp, preset="default", bit_depth="auto", metadata=True, dpi=None):
+    """Write img as PNG to a path or a binary file object.
+
+    bit_depth "auto" turns two-color RGB images into 1 bit palette PNGs
+    (palette images already get the smallest depth their palette allows);
+    "keep" writes the pixels as they are. metadata=False leaves out every
+    optional chunk, including an ICC profile carried over from a logo.
+    """
+    if preset not in PRESETS:
+        raise ValueError(f"Unknown PNG preset: {preset!r}")
+    if bit_depth == "auto":
+        img = two_color_palette(img) or img
+    elif bit_depth != "keep":
+        raise ValueError(f"Unknown bit depth: {bit_depth!r}")
+
+    params = dict(PRESETS[preset])
+    if metadata:
+        if dpi:
+            params["dpi"] = (dpi, dpi)
+    else:
+        params["icc_profile"] = None
+    img.save(fp, "PNG", **params)
+
+
+def png_bytes(img, preset="default", bit_depth="auto", metadata=True, dpi=None):
+    output = io.BytesIO()
+    save_png(img, output, preset, bit_depth, metadata, dpi)
+    return output.getvalue()
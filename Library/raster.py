@@ -0,0 +1,98 @@
+from PIL import Image, ImageColor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Module matrix -> pixels. With numpy the symbol is scaled up and padded in
+# one pass into a single 1 byte per pixel index buffer that PIL shares as a
+# "P" image; without numpy PIL scales a module-sized palette image instead.
+# Codes stay two-color until something (a logo) needs full color; RGB ones
+# are colored at one pixel per module and scaled once, so the finished
+# image is the only full-size buffer.
+
+BACK, FILL = 0, 1
+
+
+def to_rgb(color):
+    if isinstance(color, (tuple, list)):
+        return tuple(color[:3])
+    return ImageColor.getrgb(color)[:3]
+
+
+def module_indices(matrix, border):
+    # Palette index per module including the quiet zone, still at 1px per module
+    rows = np.frombuffer(matrix.packed, dtype=np.uint8).reshape(matrix.size, matrix.stride)
+    modules = np.unpackbits(rows, axis=1, count=matrix.size)
+    return np.pad(modules, border, constant_values=BACK)
+
+
+def palette_image(matrix, options):
+    """Two-entry palette image of the whole code, back_color at index 0."""
+    box_size = options["box_size"]
+    indices = module_indices(matrix, options["border"])
+    # Widen the small matrix first, so only the final repeat is full-size
+    pixels = np.repeat(np.repeat(indices, box_size, axis=1), box_size, axis=0)
+    height, width = pixels.shape
+    qr_img = Image.frombuffer("P", (width, height), pixels, "raw", "P", 0, 1)
+    qr_img.putpalette(to_rgb(options["back_color"]) + to_rgb(options["fill_color"]))
+    return qr_img
+
+
+def module_image(matrix, options):
+    """Palette image of the whole code at one pixel per module."""
+    border = options["border"]
+    units = matrix.size + 2 * border
+    small = Image.new("P", (units, units), BACK)
+    small.putpalette(to_rgb(options["back_color"]) + to_rgb(options["fill_color"]))
+    small.paste(FILL, (border, border, border + matrix.size, border + matrix.size), matrix.to_image())
+    return small
+
+
+def _pil_palette_image(matrix, options):
+    small = module_image(matrix, options)
+    size = small.width * options["box_size"]
+    return small.resize((size, size), Image.NEAREST)
+
+
+def rgb_image(matrix, options):
+    """RGB image of the whole code, scaled up from one pixel per module."""
+    small = module_image(matrix, options).convert("RGB")
+    size = small.width * options["box_size"]
+    return small.resize((size, size), Image.NEAREST)
+
+
+def bilevel_image(matrix, options):
+    """Black on white mode "1" image, 1 bit per pixel once saved."""
+    box_size = options["box_size"]
+    border = options["border"]
+    units = matrix.size + 2 * border
+    small = Image.new("1", (units, units), 1)
+    small.paste(0, (border, border, border + matrix.size, border + matrix.size), matrix.to_image())
+    return small.resize((units * box_size, units * box_size), Image.NEAREST)
+
+
+def is_black_on_white(options):
+    return to_rgb(options["fill_color"]) == (0, 0, 0) and to_rgb(options["back_color"]) == (255, 255, 255)
+
+
+def rasterize(matrix, options, mode="RGB"):
+    """Draw matrix using the size and colors in options.
+
+    mode is "RGB", "P" (two-entry palette), "1" (black on white only) or
+    "auto", which picks "1" for black on white and "P" otherwise.
+    """
+    if mode == "auto":
+        mode = "1" if is_black_on_white(options) else "P"
+    if mode == "1":
+        if not is_black_on_white(options):
+            raise ValueError('Image mode "1" needs black fill on a white background.')
+        return bilevel_image(matrix, options)
+    if mode == "RGB":
+        return rgb_image(matrix, options)
+
+    qr_img = _pil_palette_image(matrix, options) if np is None else palette_image(matrix, options)
+    if mode == "P":
+        return qr_img
+    return qr_img.convert(mode)
@@ -0,0 +1,116 @@
+from qrcode import util
+
+# Optimal segmentation of a payload into numeric, alphanumeric, byte and
+# (optionally) kanji segments. Dynamic programming over the characters
+# finds the split with the fewest bits for a given character count field
+# width, i.e. per version class.
+
+MODE_NUMBER = util.MODE_NUMBER
+MODE_ALPHA_NUM = util.MODE_ALPHA_NUM
+MODE_BYTE = util.MODE_8BIT_BYTE
+MODE_KANJI = util.MODE_KANJI
+
+ALPHA_NUM = frozenset(util.ALPHA_NUM.decode("ascii"))
+DIGITS = frozenset("0123456789")
+
+
+class KanjiData:
+    """Kanji mode segment, written as 13 bits per Shift JIS character.
+
+    Quacks like qrcode's QRData so it can go through util.create_data.
+    """
+
+    mode = MODE_KANJI
+
+    def __init__(self, text):
+        self.data = text.encode("shift_jis")
+
+    def __len__(self):
+        return len(self.data) // 2
+
+    def write(self, buffer):
+        for i in range(0, len(self.data), 2):
+            value = self.data[i] << 8 | self.data[i + 1]
+            value -= 0x8140 if value <= 0x9FFC else 0xC140
+            buffer.put((value >> 8) * 0xC0 + (value & 0xFF), 13)
+
+    def __repr__(self):
+        return f"KanjiData({self.data.decode('shift_jis')!r})"
+
+
+def is_kanji(char):
+    try:
+        encoded = char.encode("shift_jis")
+    except UnicodeEncodeError:
+        return False
+    if len(encoded) != 2:
+        return False
+    value = encoded[0] << 8 | encoded[1]
+    return 0x8140 <= value <= 0x9FFC or 0xE040 <= value <= 0xEBBF
+
+
+def _char_costs(char, kanji):
+    # Cost of one character per mode in sixths of a bit, None if impossible
+    return {
+        MODE_NUMBER: 20 if char in DIGITS else None,
+        MODE_ALPHA_NUM: 33 if char in ALPHA_NUM else None,
+        MODE_BYTE: 48 * len(char.encode("utf-8")),
+        MODE_KANJI: 78 if kanji and is_kanji(char) else None,
+    }
+
+
+def character_modes(text, version, kanji=False):
+    """Mode for every character of text that minimises the total bits."""
+    modes = (MODE_BYTE, MODE_ALPHA_NUM, MODE_NUMBER, MODE_KANJI) if kanji else (MODE_BYTE, MODE_ALPHA_NUM, MODE_NUMBER)
+    sizes = util.mode_sizes_for_version(version)
+    head = {mode: (4 + sizes[mode]) * 6 for mode in modes}
+
+    # costs[mode]: cheapest encoding of the prefix that ends in mode with
+    # the segment still open; came_from[i][mode]: mode character i used
+    costs = dict(head)
+    came_from = []
+    for char in text:
+        char_costs = _char_costs(char, kanji)
+        extended = {}
+        used = {}
+        for mode in modes:
+            if char_costs[mode] is not None:
+                extended[mode] = costs[mode] + char_costs[mode]
+                used[mode] = mode
+        current = dict(extended)
+        # Close the segment after this character and open one in another mode
+        for target in modes:
+            for source, cost in extended.items():
+                switched = (cost + 5) // 6 * 6 + head[target]
+                if target not in current or switched < current[target]:
+                    current[target] = switched
+                    used[target] = source
+        came_from.append(used)
+        costs = current
+
+    mode = min(costs, key=costs.get)
+    result = []
+    for used in reversed(came_from):
+        mode = used[mode]
+        result.append(mode)
+    result.reverse()
+    return result
+
+
+def optimal_segments(text, version, kanji=False):
+    """QRData/KanjiData segments for text with the fewest bits at version."""
+    if isinstance(text, bytes):
+        text = text.decode("utf-8")
+    segments = []
+    start = 0
+    modes = character_modes(text, version, kanji)
+    for end in range(1, len(text) + 1):
+        if end < len(text) and modes[end] == modes[start]:
+            continue
+        chunk = text[start:end]
+        if modes[start] == MODE_KANJI:
+            segments.append(KanjiData(chunk))
+        else:
+            segments.append(util.QRData(chunk.encode("utf-8"), mode=modes[start], check_data=False))
+        start = end
+    return segments
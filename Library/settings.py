@@ -1,17 +1,21 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, colorchooser
+from tkinter import filedialog, messagebox, colorchooser, ttk
 import os
 
-def open_settings_window(
-    root,
-    fill_color,
-    back_color,
-    error_level,
-    logo_path,
-    use_logo,
-    logo_position,
-    save_config_callback
-):
+from Library.config import STYLE_DEFAULTS
+
+def tk_color(color):
+    # Profiles may hold [r, g, b] lists; Tk only takes names and #rrggbb
+    if isinstance(color, (list, tuple)):
+        return "#{:02x}{:02x}{:02x}".format(*color[:3])
+    return color
+
+def open_settings_window(root, profiles, active, save_config_callback):
+    """Edit a style profile; calls save_config_callback(name, style) on save.
+
+    Picking another profile loads it into the window, typing a new name
+    saves the settings as a new profile.
+    """
     settings_win = tk.Toplevel(root)
     settings_win.title("Advanced Settings")
     settings_win.resizable(False, False)
@@ -29,10 +33,12 @@ def open_settings_window(
 
     settings_win.protocol("WM_DELETE_WINDOW", on_close)
 
+    style = dict(STYLE_DEFAULTS, **profiles.get(active, {}))
+
     # --- Internal state updates ---
-    current_fill_color = fill_color
-    current_back_color = back_color
-    current_logo_path = logo_path
+    current_fill_color = tk_color(style["fill_color"])
+    current_back_color = tk_color(style["back_color"])
+    current_logo_path = style["logo_path"]
 
     # Choose color
     def choose_color(which, button):
@@ -46,9 +52,18 @@ def open_settings_window(
                 current_back_color = color[1]
             button.config(bg=color[1])
 
+    # Profile row
+    profile_frame = tk.Frame(settings_win)
+    profile_frame.pack(pady=(15, 0))
+
+    tk.Label(profile_frame, text="Profile:", font=("Helvetica", 10)).grid(row=0, column=0, padx=5)
+    profile_var = tk.StringVar(value=active)
+    profile_box = ttk.Combobox(profile_frame, textvariable=profile_var, values=sorted(profiles), width=15)
+    profile_box.grid(row=0, column=1, padx=5)
+
     # Color row
     color_frame = tk.Frame(settings_win)
-    color_frame.pack(pady=(15, 5))
+    color_frame.pack(pady=(10, 5))
 
     tk.Label(color_frame, text="Fill Color:", font=("Helvetica", 10)).grid(row=0, column=0, padx=5)
     fill_button = tk.Button(color_frame, width=10, bg=current_fill_color, command=lambda: choose_color('fill', fill_button))
@@ -83,13 +98,13 @@ def open_settings_window(
 
     info_button.bind("<Button-1>", show_ec_info)
 
-    ec_var = tk.StringVar(value=error_level)
+    ec_var = tk.StringVar(value=style["error_level"])
     ec_menu = tk.OptionMenu(settings_win, ec_var, "L", "M", "Q", "H")
     ec_menu.config(width=5)
     ec_menu.pack()
 
     # Logo enable checkbox
-    logo_check_var = tk.BooleanVar(value=use_logo)
+    logo_check_var = tk.BooleanVar(value=style["use_logo"])
     logo_check = tk.Checkbutton(
         settings_win,
         text="Enable Logo",
@@ -144,20 +159,35 @@ def open_settings_window(
 
     # Logo position
     tk.Label(settings_win, text="Logo Position:", font=("Helvetica", 10)).pack(pady=(8, 0))
-    logo_pos_var = tk.StringVar(value=logo_position)
+    logo_pos_var = tk.StringVar(value=style["logo_position"])
     pos_menu = tk.OptionMenu(settings_win, logo_pos_var, "center", "top-left", "top-right", "bottom-left", "bottom-right")
     pos_menu.config(width=12)
     pos_menu.pack()
 
+    def show_profile(event=None):
+        nonlocal current_fill_color, current_back_color, current_logo_path
+        style = dict(STYLE_DEFAULTS, **profiles.get(profile_var.get(), {}))
+        current_fill_color = tk_color(style["fill_color"])
+        current_back_color = tk_color(style["back_color"])
+        current_logo_path = style["logo_path"]
+        fill_button.config(bg=current_fill_color)
+        back_button.config(bg=current_back_color)
+        ec_var.set(style["error_level"])
+        logo_check_var.set(style["use_logo"])
+        logo_pos_var.set(style["logo_position"])
+        update_logo_display()
+
+    profile_box.bind("<<ComboboxSelected>>", show_profile)
+
     def save_and_close():
-        save_config_callback(
-            ec_var.get(),
-            logo_check_var.get(),
-            logo_pos_var.get(),
-            current_logo_path,
-            current_fill_color,
-            current_back_color
-        )
+        save_config_callback(profile_var.get().strip() or active, {
+            "error_level": ec_var.get(),
+            "use_logo": logo_check_var.get(),
+            "logo_position": logo_pos_var.get(),
+            "logo_path": current_logo_path,
+            "fill_color": current_fill_color,
+            "back_color": current_back_color,
+        })
         on_close()
 
     tk.Button(settings_win, text="Save Settings", font=("Helvetica", 10, "bold"), command=save_and_close).pack(pady=15)
@@ -0,0 +1,216 @@
+import atexit
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Opt-in per-stage instrumentation. The engine wraps every stage in
+# trace.stage(...); while no tracer is installed that returns one shared
+# do-nothing object, so the disabled cost is a global lookup and a call.
+#
+# A tracer hands one record per finished stage to its sinks:
+#   {"stage": "rasterize", "render": 12, "parent": "render", "ms": 1.92,
+#    "width": 1160, "height": 1160, "mode": "P"}
+# with "alloc_bytes" added when memory tracing is on. Any callable taking
+# that dict is a sink; LogSink writes JSON lines, PrometheusSink keeps
+# aggregates for a text exposition dump.
+
+# Histogram buckets for stage durations, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+tracer = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "fields", "start", "allocated", "parent")
+
+    def __init__(self, tracer, name, fields):
+        self.tracer = tracer
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        """Attach details only known mid-stage (image size, version, ...)."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        self.parent = self.tracer._enter(self)
+        self.allocated = tracemalloc.get_traced_memory()[0] if self.tracer.memory else 0
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        record = {"stage": self.name, "render": self.tracer._exit(), "parent": self.parent, "ms": round(seconds * 1000, 3)}
+        if self.tracer.memory:
+            record["alloc_bytes"] = tracemalloc.get_traced_memory()[0] - self.allocated
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        record.update(self.fields)
+        self.tracer.emit(record)
+        return False
+
+
+class Tracer:
+    """Times nested stages per thread and passes each record to the sinks.
+
+    With memory=True tracemalloc is started and every record also carries
+    the bytes the stage left allocated (Python and numpy memory; PIL's own
+    pixel buffers are invisible to tracemalloc). tracemalloc slows every
+    allocation in the process, so it is off by default.
+    """
+
+    def __init__(self, sinks=(), memory=False):
+        self.sinks = list(sinks)
+        self.memory = memory
+        self._local = threading.local()
+        self._renders = itertools.count(1)
+        self.started_tracemalloc = memory and not tracemalloc.is_tracing()
+        if self.started_tracemalloc:
+            tracemalloc.start()
+
+    def span(self, name, **fields):
+        return Span(self, name, fields)
+
+    def _enter(self, span):
+        stack = getattr(self._local, "stack", None)
+        if not stack:
+            stack = self._local.stack = []
+            self._local.render = next(self._renders)
+        parent = stack[-1].name if stack else None
+        stack.append(span)
+        return parent
+
+    def _exit(self):
+        self._local.stack.pop()
+        return self._local.render
+
+    def emit(self, record):
+        for sink in self.sinks:
+            sink(record)
+
+
+class LogSink:
+    """Writes every record as one JSON line."""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            stream = self.stream or sys.stderr
+            stream.write(line)
+            stream.flush()
+
+
+class PrometheusSink:
+    """Per-stage duration histograms and allocation totals."""
+
+    def __init__(self, prefix="qrcode"):
+        self.prefix = prefix
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        seconds = record["ms"] / 1000
+        with self._lock:
+            stage = self._stages.get(record["stage"])
+            if stage is None:
+                stage = self._stages[record["stage"]] = {
+                    "buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0, "errors": 0, "alloc": 0
+                }
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stage["buckets"][index] += 1
+            stage["count"] += 1
+            stage["sum"] += seconds
+            stage["errors"] += "error" in record
+            stage["alloc"] += record.get("alloc_bytes", 0)
+
+    def render(self):
+        """The aggregates in Prometheus text exposition format."""
+        name = f"{self.prefix}_stage_seconds"
+        lines = [f"# HELP {name} Time spent in each render stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            stages = {stage: dict(values, buckets=list(values["buckets"])) for stage, values in self._stages.items()}
+        for stage, values in sorted(stages.items()):
+            for bound, count in zip(BUCKETS, values["buckets"]):
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {values["count"]}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {values["sum"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {values["count"]}')
+        for metric, key, help_text in (
+            ("stage_errors_total", "errors", "Stages that raised."),
+            ("stage_alloc_bytes_total", "alloc", "Bytes left allocated by each stage (memory tracing only)."),
+        ):
+            lines += [f"# HELP {self.prefix}_{metric} {help_text}", f"# TYPE {self.prefix}_{metric} counter"]
+            lines += [f'{self.prefix}_{metric}{{stage="{stage}"}} {values[key]}' for stage, values in sorted(stages.items())]
+        return "\n".join(lines) + "\n"
+
+
+def stage(name, **fields):
+    """Context manager timing one stage; a shared no-op while tracing is off."""
+    if tracer is None:
+        return _NULL_SPAN
+    return tracer.span(name, **fields)
+
+
+def enable(sinks=(), memory=False):
+    global tracer
+    tracer = Tracer(sinks, memory)
+    return tracer
+
+
+def disable():
+    global tracer
+    if tracer is not None and tracer.started_tracemalloc:
+        tracemalloc.stop()
+    tracer = None
+
+
+def enable_from_env(variable="QRCODE_TRACE"):
+    """Turn tracing on from an environment variable.
+
+    "log" writes JSON lines to stderr, "prometheus:<path>" writes the
+    metrics to path when the process exits; add "+memory" to either one to
+    record allocations too, e.g. QRCODE_TRACE=log+memory.
+    """
+    setting = os.environ.get(variable, "")
+    if not setting:
+        return None
+    setting, _, extra = setting.partition("+")
+    memory = extra == "memory"
+    if setting == "log":
+        return enable([LogSink()], memory)
+    if setting.startswith("prometheus:"):
+        path = setting.split(":", 1)[1]
+        sink = PrometheusSink()
+
+        def dump():
+            with open(path, "w") as f:
+                f.write(sink.render())
+
+        atexit.register(dump)
+        return enable([sink], memory)
+    raise ValueError(f"Unknown {variable} setting: {setting!r}")
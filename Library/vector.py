@@ -0,0 +1,197 @@
+import base64
+import io
+import zlib
+from html import escape
+
+from Library.raster import to_rgb
+
+# Vector output written straight from the module matrix, no raster involved.
+# Dark modules are merged into rectangles: horizontal runs first, then runs
+# with the same span on consecutive rows are stacked into one rectangle.
+
+# Pixels are treated as CSS pixels (96 per inch) when sizing PDF pages
+PT_PER_PX = 0.75
+
+PDF_HEADER = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+
+
+def runs(row):
+    x = 0
+    size = len(row)
+    while x < size:
+        if not row[x]:
+            x += 1
+            continue
+        start = x
+        while x < size and row[x]:
+            x += 1
+        yield start, x - start
+
+
+def rectangles(rows):
+    """Merge dark modules into (x, y, width, height) rectangles."""
+    done = []
+    growing = {}
+    for y, row in enumerate(rows):
+        current = {}
+        for x, width in runs(row):
+            rect = growing.pop((x, width), None) or [x, y, width, 0]
+            rect[3] += 1
+            current[(x, width)] = rect
+        done.extend(growing.values())
+        growing = current
+    done.extend(growing.values())
+    done.sort(key=lambda rect: (rect[1], rect[0]))
+    return done
+
+
+def svg_color(color):
+    if isinstance(color, (tuple, list)):
+        return "rgb({},{},{})".format(*color[:3])
+    return str(color)
+
+
+def _num(value):
+    return f"{value:.4f}".rstrip("0").rstrip(".")
+
+
+def _png_bytes(img):
+    output = io.BytesIO()
+    img.save(output, "PNG")
+    return output.getvalue()
+
+
+def svg_bytes(matrix, options, logo=None):
+    """SVG document for matrix; logo is an optional (RGBA image, (x, y) px) pair."""
+    border = options["border"]
+    box_size = options["box_size"]
+    units = matrix.size + 2 * border
+    pixels = units * box_size
+
+    path = "".join(
+        f"M{x + border},{y + border}h{width}v{height}h-{width}z"
+        for x, y, width, height in rectangles(matrix.rows())
+    )
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="{pixels}" height="{pixels}" viewBox="0 0 {units} {units}" shape-rendering="crispEdges">',
+        f'<rect width="{units}" height="{units}" fill="{escape(svg_color(options["back_color"]))}"/>',
+        f'<path d="{path}" fill="{escape(svg_color(options["fill_color"]))}"/>',
+    ]
+    if logo is not None:
+        logo_img, (x, y) = logo
+        href = "data:image/png;base64," + base64.b64encode(_png_bytes(logo_img)).decode("ascii")
+        parts.append(
+            f'<image x="{_num(x / box_size)}" y="{_num(y / box_size)}" '
+            f'width="{_num(logo_img.width / box_size)}" height="{_num(logo_img.height / box_size)}" '
+            f'shape-rendering="auto" xlink:href="{href}"/>'
+        )
+    parts.append("</svg>\n")
+    return "".join(parts).encode("utf-8")
+
+
+def _pdf_color(color, operator):
+    return " ".join(_num(channel / 255) for channel in to_rgb(color)) + f" {operator}"
+
+
+def _pdf_stream(dictionary, data):
+    data = zlib.compress(data)
+    return f"<< {dictionary} /Filter /FlateDecode /Length {len(data)} >>\nstream\n".encode("ascii") + data + b"\nendstream"
+
+
+def pdf_bytes(matrix, options, logo=None):
+    """Single-page PDF for matrix; logo is an optional (RGBA image, (x, y) px) pair."""
+    border = options["border"]
+    box_size = options["box_size"]
+    units = matrix.size + 2 * border
+    module_pt = box_size * PT_PER_PX
+    page = _num(units * module_pt)
+
+    # Modules are drawn in module units with the origin at the top left
+    content = [
+        _pdf_color(options["back_color"], "rg"),
+        f"0 0 {page} {page} re f",
+        "q",
+        f"{_num(module_pt)} 0 0 {_num(-module_pt)} 0 {page} cm",
+        _pdf_color(options["fill_color"], "rg"),
+    ]
+    content.extend(f"{x + border} {y + border} {width} {height} re" for x, y, width, height in rectangles(matrix.rows()))
+    content.extend(["f", "Q"])
+
+    resources = ""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        None,
+        None,
+    ]
+    if logo is not None:
+        logo_img, (x, y) = logo
+        width, height = logo_img.width * PT_PER_PX, logo_img.height * PT_PER_PX
+        bottom = (units * box_size - y - logo_img.height) * PT_PER_PX
+        content.append(f"q {_num(width)} 0 0 {_num(height)} {_num(x * PT_PER_PX)} {_num(bottom)} cm /Logo Do Q")
+        image = f"/Type /XObject /Subtype /Image /Width {logo_img.width} /Height {logo_img.height} /BitsPerComponent 8"
+        objects.append(_pdf_stream(f"{image} /ColorSpace /DeviceRGB /SMask 6 0 R", logo_img.convert("RGB").tobytes()))
+        objects.append(_pdf_stream(f"{image} /ColorSpace /DeviceGray", logo_img.getchannel("A").tobytes()))
+        resources = "/XObject << /Logo 5 0 R >>"
+
+    objects[2] = f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page} {page}] /Resources << {resources} >> /Contents 4 0 R >>".encode("ascii")
+    objects[3] = _pdf_stream("", "\n".join(content).encode("ascii"))
+    return _pdf_document(objects)
+
+
+def image_pdf_bytes(img, dpi):
+    """Single-page PDF showing a raster image (mode "1", "L" or RGB) at dpi."""
+    if img.mode in ("1", "L"):
+        colorspace, bits = "/DeviceGray", 1 if img.mode == "1" else 8
+    else:
+        img = img.convert("RGB")
+        colorspace, bits = "/DeviceRGB", 8
+    width = _num(img.width * 72 / dpi)
+    height = _num(img.height * 72 / dpi)
+    image = f"/Type /XObject /Subtype /Image /Width {img.width} /Height {img.height} /BitsPerComponent {bits} /ColorSpace {colorspace}"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] /Resources << /XObject << /Page 5 0 R >> >> /Contents 4 0 R >>".encode("ascii"),
+        _pdf_stream("", f"q {width} 0 0 {height} 0 0 cm /Page Do Q".encode("ascii")),
+        _pdf_stream(image, img.tobytes()),
+    ]
+    return _pdf_document(objects)
+
+
+def _pdf_document(objects):
+    output = bytearray(PDF_HEADER)
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += pdf_object(number, body)
+    output += pdf_trailer(offsets, len(output))
+    return bytes(output)
+
+
+def pdf_object(number, body):
+    return f"{number} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+
+
+def pdf_trailer(offsets, xref):
+    """xref table and trailer for objects 1..n at offsets; object 1 is the catalog."""
+    output = f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode("ascii")
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("ascii")
+    output += f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return output
+
+
+def pdf_objects(data):
+    """Object bodies of a PDF written by pdf_bytes, in object number order.
+
+    Only meant for our own output: objects are located through the xref
+    table and each one ends right before the next one starts.
+    """
+    xref = int(data[data.rindex(b"startxref") + 10:].split()[0])
+    count = int(data[xref:xref + 32].split()[2])
+    table = data.index(b"\n", data.index(b"\n", xref) + 1) + 1
+    offsets = [int(data[table + 20 * i:table + 20 * i + 10]) for i in range(1, count)]
+    ends = offsets[1:] + [xref]
+    return [data[data.index(b"obj\n", start) + 4:end - len(b"\nendobj\n")] for start, end in zip(offsets, ends)]
@@ -0,0 +1,351 @@
+import io
+import random
+from collections import namedtuple
+from functools import lru_cache
+
+from PIL import Image
+from qrcode import util
+
+from Library import layout
+from Library.raster import to_rgb
+
+np = layout.np
+
+# Scan verification: a small QR decoder that reads a rendered code back the
+# way a scanner would (sample every module, read the format bits, unmask,
+# de-interleave, Reed-Solomon correct, parse the segments) and checks that
+# the payload comes out unchanged. Sampling and syndromes are numpy array
+# operations; only damaged blocks go through the Python error locator.
+#
+# The margin of a code is how many more codewords its weakest block could
+# lose and still decode, so 0 means it scans now but any more damage (a
+# scratch, a smudge, a bigger logo) breaks it, and -1 means it does not
+# decode at all.
+
+Verification = namedtuple("Verification", "ok margin capacity errors message")
+
+
+class DecodeError(ValueError):
+    pass
+
+
+# GF(256) over x^8 + x^4 + x^3 + x^2 + 1, as used by QR codes
+GF_EXP = [0] * 512
+GF_LOG = [0] * 256
+_value = 1
+for _power in range(255):
+    GF_EXP[_power] = GF_EXP[_power + 255] = _value
+    GF_LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+GF_EXP[510] = GF_EXP[0]
+GF_EXP_ARRAY = np.array(GF_EXP, dtype=np.uint8) if np is not None else None
+GF_LOG_ARRAY = np.array(GF_LOG, dtype=np.intp) if np is not None else None
+
+
+def gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + GF_LOG[b]]
+
+
+def gf_div(a, b):
+    if a == 0:
+        return 0
+    return GF_EXP[GF_LOG[a] + 255 - GF_LOG[b]]
+
+
+def poly_eval(poly, x):
+    # poly is lowest degree first
+    result = 0
+    for coefficient in reversed(poly):
+        result = gf_mul(result, x) ^ coefficient
+    return result
+
+
+@lru_cache(maxsize=None)
+def _syndrome_powers(length, ec_count):
+    # Exponent of alpha^j * x^(length-1-i) for syndrome j and codeword i
+    powers = np.outer(np.arange(ec_count), np.arange(length - 1, -1, -1)) % 255
+    powers.setflags(write=False)
+    return powers
+
+
+def syndromes(block, ec_count):
+    """S_j = block(alpha^j) for j < ec_count, all at once."""
+    codewords = np.frombuffer(bytes(block), dtype=np.uint8)
+    nonzero = codewords != 0
+    exponents = (_syndrome_powers(len(codewords), ec_count)[:, nonzero] + GF_LOG_ARRAY[codewords[nonzero]]) % 255
+    return np.bitwise_xor.reduce(GF_EXP_ARRAY[exponents], axis=1) if nonzero.any() else np.zeros(ec_count, dtype=np.uint8)
+
+
+def error_locator(synd):
+    """Berlekamp-Massey: the error locator polynomial, lowest degree first."""
+    locator, previous = [1], [1]
+    errors, shift, last = 0, 1, 1
+    for r, syndrome in enumerate(synd):
+        discrepancy = syndrome
+        for i in range(1, errors + 1):
+            discrepancy ^= gf_mul(locator[i], synd[r - i])
+        if discrepancy == 0:
+            shift += 1
+            continue
+        scale = gf_div(discrepancy, last)
+        update = [0] * shift + [gf_mul(scale, c) for c in previous]
+        new = [a ^ b for a, b in zip(locator + [0] * (len(update) - len(locator)), update + [0] * (len(locator) - len(update)))]
+        if 2 * errors <= r:
+            previous, last = locator, discrepancy
+            errors = r + 1 - errors
+            shift = 1
+        else:
+            shift += 1
+        locator = new
+    return locator[:errors + 1], errors
+
+
+def correct_block(block, ec_count):
+    """Correct one Reed-Solomon block in place; returns the number of errors fixed."""
+    synd = syndromes(block, ec_count)
+    if not synd.any():
+        return 0
+    synd = [int(s) for s in synd]
+    locator, count = error_locator(synd)
+    if 2 * count > ec_count:
+        raise DecodeError("too many errors")
+
+    # Chien search: an error at x^p makes alpha^-p a root of the locator
+    length = len(block)
+    positions = [p for p in range(length) if poly_eval(locator, GF_EXP[255 - p]) == 0]
+    if len(positions) != count:
+        raise DecodeError("too many errors")
+
+    # Forney: error value = X * omega(X^-1) / locator'(X^-1)
+    omega = [0] * ec_count
+    for i, s in enumerate(synd):
+        for j, c in enumerate(locator):
+            if i + j < ec_count:
+                omega[i + j] ^= gf_mul(s, c)
+    derivative = [locator[i] if i % 2 else 0 for i in range(1, len(locator))]
+    for p in positions:
+        inverse = GF_EXP[255 - p]
+        denominator = poly_eval(derivative, inverse)
+        if denominator == 0:
+            raise DecodeError("too many errors")
+        block[length - 1 - p] ^= gf_mul(GF_EXP[p], gf_div(poly_eval(omega, inverse), denominator))
+
+    if syndromes(block, ec_count).any():
+        raise DecodeError("too many errors")
+    return count
+
+
+def read_format(modules, version):
+    """(error correction, mask) from the better of the two format copies."""
+    cells = layout.format_cells(version)
+    best = None
+    for copy in (cells[:15], cells[15:]):
+        value = sum(int(modules[row, col]) << i for i, (row, col) in enumerate(copy))
+        for error_correction in range(4):
+            for mask in range(8):
+                distance = bin(value ^ util.BCH_type_info(error_correction << 3 | mask)).count("1")
+                if best is None or distance < best[0]:
+                    best = (distance, error_correction, mask)
+    if best[0] > 3:
+        raise DecodeError("format information is unreadable")
+    return best[1], best[2]
+
+
+class _Bits:
+    def __init__(self, data):
+        self.value = int.from_bytes(data, "big")
+        self.length = len(data) * 8
+        self.position = 0
+
+    def remaining(self):
+        return self.length - self.position
+
+    def read(self, count):
+        if count > self.remaining():
+            raise DecodeError("data ends mid-segment")
+        self.position += count
+        return self.value >> (self.length - self.position) & ((1 << count) - 1)
+
+
+def parse_segments(data, version):
+    """The payload text encoded in the corrected data codewords."""
+    bits = _Bits(data)
+    output = bytearray()
+    while bits.remaining() >= 4:
+        mode = bits.read(4)
+        if mode == 0:
+            break
+        if mode == 7:
+            # ECI designator; the payload bytes are kept as they are
+            first = bits.read(8)
+            bits.read(0 if first < 0x80 else 8 if first < 0xC0 else 16)
+            continue
+        if mode not in (util.MODE_NUMBER, util.MODE_ALPHA_NUM, util.MODE_8BIT_BYTE, util.MODE_KANJI):
+            raise DecodeError(f"unknown segment mode {mode}")
+        count = bits.read(util.length_in_bits(mode, version))
+        if mode == util.MODE_NUMBER:
+            while count >= 3:
+                output += b"%03d" % bits.read(10)
+                count -= 3
+            if count:
+                output += b"%0*d" % (count, bits.read(7 if count == 2 else 4))
+        elif mode == util.MODE_ALPHA_NUM:
+            while count >= 2:
+                pair = bits.read(11)
+                output += util.ALPHA_NUM[pair // 45:pair // 45 + 1] + util.ALPHA_NUM[pair % 45:pair % 45 + 1]
+                count -= 2
+            if count:
+                index = bits.read(6)
+                output += util.ALPHA_NUM[index:index + 1]
+        elif mode == util.MODE_8BIT_BYTE:
+            output += bytes(bits.read(8) for _ in range(count))
+        else:
+            for _ in range(count):
+                value = bits.read(13)
+                code = (value // 0xC0) << 8 | value % 0xC0
+                code += 0x8140 if code + 0x8140 <= 0x9FFC else 0xC140
+                output += code.to_bytes(2, "big").decode("shift_jis", errors="replace").encode("utf-8")
+    return output.decode("utf-8", errors="replace")
+
+
+# Wrong modules a locator pattern may have before scanners stop finding it
+PATTERN_TOLERANCE = 1
+
+
+def finder_corners(size):
+    # (rows, cols) of each finder pattern with its light separator
+    return ((slice(0, 8), slice(0, 8)), (slice(size - 8, size), slice(0, 8)), (slice(0, 8), slice(size - 8, size)))
+
+
+def check_finders(modules):
+    """DecodeError if a finder pattern is damaged.
+
+    Scanners locate a code by its three finder patterns, so a covered one
+    makes the code unreadable however recoverable its data is.
+    """
+    size = len(modules)
+    _, dark = layout.function_template((size - 17) // 4)
+    for rows, cols in finder_corners(size):
+        wrong = np.count_nonzero(modules[rows, cols] != dark[rows, cols])
+        if wrong > PATTERN_TOLERANCE:
+            raise DecodeError(f"a finder pattern is covered ({wrong} modules wrong)")
+
+
+def decode_modules(modules):
+    """(payload, per-block (errors, capacity)) for a boolean module array."""
+    size = len(modules)
+    version = (size - 17) // 4
+    if not 1 <= version <= 40 or layout.size_for(version) != size:
+        raise DecodeError(f"{size} modules is not a QR code size")
+    check_finders(modules)
+    error_correction, mask = read_format(modules, version)
+    unmasked = modules ^ layout.mask_patterns(version)[mask]
+
+    blocks = layout.block_layout(version, error_correction)
+    total = sum(len(indices) for indices, _ in blocks)
+    rows, cols = layout.data_order(version)
+    stream = np.packbits(unmasked[rows[:total * 8], cols[:total * 8]])
+
+    data = bytearray()
+    counts = []
+    for indices, data_count in blocks:
+        block = bytearray(stream[indices].tobytes())
+        ec_count = len(block) - data_count
+        try:
+            errors = correct_block(block, ec_count)
+        except DecodeError:
+            raise DecodeError(f"a block has more than {ec_count // 2} damaged codewords") from None
+        counts.append((errors, ec_count // 2))
+        data += block[:data_count]
+    return parse_segments(bytes(data), version), counts
+
+
+def sample_modules(img, options):
+    """Dark/light per module, read from the middle of each module's box."""
+    box_size, border = options["box_size"], options["border"]
+    size = img.width // box_size - 2 * border
+    if size < 21 or img.width != img.height or img.width != (size + 2 * border) * box_size:
+        raise DecodeError("image size does not match box size and border")
+
+    def luminance(color):
+        red, green, blue = to_rgb(color)
+        return (red * 299 + green * 587 + blue * 114) / 1000
+
+    dark, light = luminance(options["fill_color"]), luminance(options["back_color"])
+    if dark == light:
+        raise DecodeError("fill and background colors cannot be told apart")
+
+    units = size + 2 * border
+    pixels = np.asarray(img.convert("L"), dtype=np.float32)
+    # The central half of every box, or its middle pixel for tiny boxes
+    low, high = box_size // 4, box_size - box_size // 4
+    if high <= low:
+        low, high = box_size // 2, box_size // 2 + 1
+    means = pixels.reshape(units, box_size, units, box_size)[:, low:high, :, low:high].mean(axis=(1, 3))
+    threshold = (dark + light) / 2
+    modules = means < threshold if dark < light else means > threshold
+    if border:
+        # The finders also need the light margin around them
+        quiet = modules.copy()
+        quiet[border:border + size, border:border + size] = False
+        reach = border + 8
+        for rows, cols in ((slice(0, reach), slice(0, reach)), (slice(-reach, None), slice(0, reach)),
+                           (slice(0, reach), slice(-reach, None))):
+            if quiet[rows, cols].any():
+                raise DecodeError("the quiet zone next to a finder pattern is covered")
+    return modules[border:border + size, border:border + size]
+
+
+def damage(modules, fraction, seed=0):
+    """Copy of modules with a fraction of the data modules flipped at random."""
+    if not fraction:
+        return modules
+    version = (len(modules) - 17) // 4
+    rows, cols = layout.data_order(version)
+    picked = random.Random(seed).sample(range(len(rows)), int(len(rows) * fraction))
+    damaged = modules.copy()
+    damaged[rows[picked], cols[picked]] ^= True
+    return damaged
+
+
+def verify_modules(modules, data, damage_fraction=0.0, seed=0):
+    """Decode a module array (after optional simulated damage) and compare with data."""
+    try:
+        payload, counts = decode_modules(damage(modules, damage_fraction, seed))
+    except DecodeError as e:
+        return Verification(False, -1, None, None, str(e))
+    errors, capacity = min(counts, key=lambda count: count[1] - count[0])
+    total = sum(count[0] for count in counts)
+    if payload != data:
+        return Verification(False, capacity - errors, capacity, total, "decoded payload differs")
+    return Verification(True, capacity - errors, capacity, total, None)
+
+
+def verify_image(img, data, options, damage_fraction=0.0, seed=0):
+    """Verify a rendered image (a PIL image or encoded PNG/BMP/... bytes)."""
+    if np is None:
+        raise RuntimeError("Verification needs numpy.")
+    if isinstance(img, (bytes, bytearray)):
+        img = Image.open(io.BytesIO(img))
+    try:
+        modules = sample_modules(img, options)
+    except DecodeError as e:
+        return Verification(False, -1, None, None, str(e))
+    return verify_modules(modules, data, damage_fraction, seed)
+
+
+def verify_output(output, data, options, damage_fraction=0.0, seed=0):
+    """Verify what engine.render returned for data and options.
+
+    SVG and PDF output is checked through a small raster render with the
+    same options, which places the logo over the same modules.
+    """
+    from Library import engine
+    if options["format"] in engine.VECTOR_FORMATS:
+        options = dict(options, format=None, box_size=4)
+        output = engine.render(data, options)
+    return verify_image(output, data, options, damage_fraction, seed)
@@ -0,0 +1,85 @@
+import queue
+import threading
+from collections import deque, namedtuple
+
+# Background rendering for the GUI. Tk must only be touched from the main
+# thread, so results are handed back through a queue that the GUI polls
+# with root.after.
+
+RenderResult = namedtuple("RenderResult", "job_id data options image error logo_errors")
+
+
+class RenderWorker:
+    """Renders on a background thread where only the newest request counts.
+
+    submit() replaces any request that has not started yet, and poll()
+    drops results of requests that were superseded while rendering, so a
+    slow render can never overwrite a newer one. With latest_only=False
+    every request is rendered in order and every result is returned.
+
+    render defaults to engine.render, imported on the worker thread so the
+    GUI does not wait for the render stack before showing its window.
+    """
+
+    def __init__(self, render=None, latest_only=True):
+        self._render = render
+        self._latest_only = latest_only
+        self._latest = 0
+        self._pending = deque()
+        self._running = None
+        self._condition = threading.Condition()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="render-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, data, options):
+        with self._condition:
+            self._latest += 1
+            if self._latest_only:
+                self._pending.clear()
+            self._pending.append((self._latest, data, options))
+            self._condition.notify()
+            return self._latest
+
+    def cancel(self):
+        with self._condition:
+            self._latest += 1
+            self._pending.clear()
+
+    @property
+    def busy(self):
+        with self._condition:
+            return bool(self._pending) or self._running is not None
+
+    def _run(self):
+        if self._render is None:
+            from Library import engine
+            self._render = engine.render
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                job_id, data, options = self._pending.popleft()
+                self._running = job_id
+
+            logo_errors = []
+            image = error = None
+            try:
+                image = self._render(data, options, on_logo_error=logo_errors.append)
+            except Exception as e:
+                error = e
+
+            # Queue the result first so busy never reads False before it is there
+            self._results.put(RenderResult(job_id, data, options, image, error, logo_errors))
+            with self._condition:
+                self._running = None
+
+    def poll(self):
+        """Return the next RenderResult that is still wanted, else None."""
+        while True:
+            try:
+                result = self._results.get_nowait()
+            except queue.Empty:
+                return None
+            if not self._latest_only or result.job_id == self._latest:
+                return result
@@ -0,0 +1,340 @@
+import csv
+import io
+import json
+import os
+import pickle
+import re
+import shutil
+import struct
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from array import array
+
+from PIL import Image
+
+from Library import vector
+
+# Batch output sinks. Every writer takes (name, bytes) pairs as they are
+# rendered and pushes them to disk immediately, so nothing accumulates:
+# not the data, and not the per-entry records tarfile and zipfile keep.
+# write() returns the entry the code ended up in (a file name or a page
+# number), which is what the manifest records.
+
+
+class Manifest:
+    """Row -> entry index, spooled to a temporary file instead of memory."""
+
+    FIELDS = ("row", "entry", "version", "modules", "bytes")
+
+    def __init__(self, fmt="csv", margins=False):
+        self.format = fmt
+        self.name = f"manifest.{fmt}"
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+        # Verification margin per code when the batch was verified
+        self.fields = self.FIELDS + ("margin",) if margins else self.FIELDS
+        if fmt == "csv":
+            self._write_csv(self.fields)
+        else:
+            self.file.write(b"[")
+
+    def _write_csv(self, values):
+        line = io.StringIO()
+        csv.writer(line).writerow(values)
+        self.file.write(line.getvalue().encode("utf-8"))
+
+    def add(self, row, entry, version, size, margin=None):
+        values = (row, entry, version, version * 4 + 17, size, margin)[:len(self.fields)]
+        if self.format == "csv":
+            self._write_csv(values)
+        else:
+            record = json.dumps(dict(zip(self.fields, values)), ensure_ascii=False)
+            self.file.write((",\n" if self.count else "\n").encode("ascii") + record.encode("utf-8"))
+        self.count += 1
+
+    def finish(self):
+        """Close the index and rewind it; returns (file, size in bytes)."""
+        if self.format == "json":
+            self.file.write(b"\n]\n")
+        size = self.file.tell()
+        self.file.seek(0)
+        return self.file, size
+
+    def close(self):
+        self.file.close()
+
+
+class DirectoryWriter:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), "wb") as f:
+            f.write(data)
+        return name
+
+    def add_manifest(self, manifest):
+        fileobj, _ = manifest.finish()
+        with open(os.path.join(self.path, manifest.name), "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+
+    def close(self):
+        pass
+
+
+class SpooledEntries:
+    """ZipInfo records in a temporary file, read back one at a time.
+
+    zipfile only needs its entry list to write the central directory on
+    close, and there it just iterates it and takes its length.
+    """
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+
+    def add(self, infos):
+        for info in infos:
+            pickle.dump(info, self.file, pickle.HIGHEST_PROTOCOL)
+        self.count += len(infos)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        self.file.seek(0)
+        for _ in range(self.count):
+            yield pickle.load(self.file)
+
+    def close(self):
+        self.file.close()
+
+
+class ZipWriter:
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, "w")
+        self.entries = SpooledEntries()
+
+    def _spool(self):
+        # Move the ZipInfo of every entry written so far out of memory
+        self.entries.add(self.archive.filelist)
+        self.archive.filelist = []
+        self.archive.NameToInfo.clear()
+
+    def write(self, name, data):
+        # PNG is already deflated, compressing it again only costs time
+        compression = zipfile.ZIP_STORED if name.lower().endswith(".png") else zipfile.ZIP_DEFLATED
+        self.archive.writestr(name, data, compress_type=compression)
+        self.archive.fp.flush()
+        self._spool()
+        return name
+
+    def add_manifest(self, manifest):
+        fileobj, _ = manifest.finish()
+        info = zipfile.ZipInfo(manifest.name, time.localtime()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with self.archive.open(info, "w") as entry:
+            shutil.copyfileobj(fileobj, entry)
+        self._spool()
+
+    def close(self):
+        self._spool()
+        self.archive.filelist = self.entries
+        try:
+            self.archive.close()
+        finally:
+            self.entries.close()
+
+
+class TarWriter:
+    def __init__(self, path):
+        mode = "w:gz" if path.endswith((".tar.gz", ".tgz")) else "w"
+        self.archive = tarfile.open(path, mode)
+
+    def write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.archive.addfile(info, io.BytesIO(data))
+        self.archive.fileobj.flush()
+        # tarfile remembers every TarInfo for reading back; a writer never does
+        self.archive.members.clear()
+        return name
+
+    def add_manifest(self, manifest):
+        fileobj, size = manifest.finish()
+        info = tarfile.TarInfo(manifest.name)
+        info.size = size
+        info.mtime = int(time.time())
+        self.archive.addfile(info, fileobj)
+
+    def close(self):
+        self.archive.close()
+
+
+def sidecar_path(path, name):
+    # codes.pdf + manifest.csv -> codes.manifest.csv
+    return f"{os.path.splitext(path)[0]}.{name}"
+
+
+# TIFF field types
+SHORT, LONG, RATIONAL = 3, 4, 5
+
+
+class TiffWriter:
+    """Multi-page TIFF, one deflate-compressed page per code.
+
+    Each page is written as it arrives and only the previous page's "next
+    IFD" pointer is patched, so memory and time per page stay constant.
+    """
+
+    page_format = "png"
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(b"II*\x00")
+        # Where the offset of the next page's IFD has to be written
+        self.link = self.file.tell()
+        self.file.write(bytes(4))
+        self.pages = 0
+
+    def _align(self):
+        if self.file.tell() % 2:
+            self.file.write(b"\x00")
+        return self.file.tell()
+
+    def _page_tags(self, img):
+        if img.mode == "P":
+            palette = img.getpalette()[:768]
+            palette += [0] * (768 - len(palette))
+            colormap = [value * 257 for channel in range(3) for value in palette[channel::3]]
+            return img, [(258, SHORT, [8]), (262, SHORT, [3]), (277, SHORT, [1]), (320, SHORT, colormap)]
+        if img.mode == "1":
+            # PIL packs 1 bit images with 1 = white
+            return img, [(258, SHORT, [1]), (262, SHORT, [1]), (277, SHORT, [1])]
+        if img.mode == "L":
+            return img, [(258, SHORT, [8]), (262, SHORT, [1]), (277, SHORT, [1])]
+        img = img.convert("RGB")
+        return img, [(258, SHORT, [8, 8, 8]), (262, SHORT, [2]), (277, SHORT, [3])]
+
+    def write(self, name, data):
+        img = Image.open(io.BytesIO(data))
+        dpi = int(round(img.info.get("dpi", (72,))[0]))
+        img, tags = self._page_tags(img)
+        strip = zlib.compress(img.tobytes())
+        strip_offset = self._align()
+        self.file.write(strip)
+        tags += [
+            (256, LONG, [img.width]),
+            (257, LONG, [img.height]),
+            # Adobe deflate
+            (259, SHORT, [8]),
+            (273, LONG, [strip_offset]),
+            (278, LONG, [img.height]),
+            (279, LONG, [len(strip)]),
+            (282, RATIONAL, [dpi, 1]),
+            (283, RATIONAL, [dpi, 1]),
+            (296, SHORT, [2]),
+        ]
+        tags.sort()
+
+        # Values that do not fit in the 4 byte entry go right before the IFD
+        entries = []
+        for tag, field_type, values in tags:
+            packed = struct.pack(f"<{len(values)}{'H' if field_type == SHORT else 'L'}", *values)
+            count = len(values) // 2 if field_type == RATIONAL else len(values)
+            if len(packed) > 4:
+                offset = self._align()
+                self.file.write(packed)
+                packed = struct.pack("<L", offset)
+            entries.append(struct.pack("<HHL", tag, field_type, count) + packed.ljust(4, b"\x00"))
+
+        ifd = self._align()
+        self.file.write(struct.pack("<H", len(entries)) + b"".join(entries))
+        next_link = self.file.tell()
+        self.file.write(bytes(4))
+
+        self.file.seek(self.link)
+        self.file.write(struct.pack("<L", ifd))
+        self.file.seek(0, os.SEEK_END)
+        self.link = next_link
+        self.pages += 1
+        return self.pages
+
+    def add_manifest(self, manifest):
+        fileobj, _ = manifest.finish()
+        with open(sidecar_path(self.path, manifest.name), "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+
+    def close(self):
+        self.file.close()
+
+
+# Object references inside a PDF dictionary
+PDF_REFERENCE = re.compile(rb"(\d+) 0 R")
+
+
+class PdfWriter:
+    """Multi-page PDF assembled from the single-page PDFs vector.pdf_bytes makes.
+
+    Every page's objects are renumbered and appended right away; only the
+    object offsets (one integer each) are kept until the xref is written.
+    """
+
+    page_format = "pdf"
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(vector.PDF_HEADER)
+        # Objects 1 and 2 are the catalog and the page tree, written on close
+        self.offsets = array("Q", [0, 0])
+        self.pages = array("L")
+
+    def write(self, name, data):
+        objects = vector.pdf_objects(data)
+        # Page objects start at 3 in a single-page file; 2 stays the page tree
+        shift = len(self.offsets) + 1 - 3
+
+        def renumber(match):
+            number = int(match.group(1))
+            return b"%d 0 R" % (number + shift if number >= 3 else number)
+
+        self.pages.append(len(self.offsets) + 1)
+        for body in objects[2:]:
+            head, stream, tail = body.partition(b"\nstream\n")
+            self.offsets.append(self.file.tell())
+            self.file.write(vector.pdf_object(len(self.offsets), PDF_REFERENCE.sub(renumber, head) + stream + tail))
+        return len(self.pages)
+
+    def add_manifest(self, manifest):
+        fileobj, _ = manifest.finish()
+        with open(sidecar_path(self.path, manifest.name), "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+
+    def close(self):
+        kids = " ".join(f"{number} 0 R" for number in self.pages)
+        self.offsets[0] = self.file.tell()
+        self.file.write(vector.pdf_object(1, b"<< /Type /Catalog /Pages 2 0 R >>"))
+        self.offsets[1] = self.file.tell()
+        self.file.write(vector.pdf_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode("ascii")))
+        self.file.write(vector.pdf_trailer(self.offsets, self.file.tell()))
+        self.file.close()
+
+
+def open_writer(path):
+    lower = path.lower()
+    if lower.endswith(".zip"):
+        return ZipWriter(path)
+    if lower.endswith((".tar", ".tar.gz", ".tgz")):
+        return TarWriter(path)
+    if lower.endswith((".tif", ".tiff")):
+        return TiffWriter(path)
+    if lower.endswith(".pdf"):
+        return PdfWriter(path)
+    return DirectoryWriter(path)
@@ -1,10 +1,9 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
-import qrcode
-import io
-import win32clipboard
-from PIL import BmpImagePlugin
+import threading
+
+# PIL and the engine are imported by preload() once the window is up (or on
+# first use, if that comes sooner) so the window shows up first
 
 # Global variable to hold latest QR image
 generated_qr_image = None
@@ -24,15 +23,9 @@ def generate_qr():
         messagebox.showerror("Error", "Box size and border must be integers.")
         return
 
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=box_size,
-        border=border
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white")
+    from PIL import Image, ImageTk
+    from Library import engine
+    qr_img = engine.render(url, {"box_size": box_size, "border": border, "error_level": "H", "image_mode": "1"})
 
     # Keep in memory
     generated_qr_image = qr_img
@@ -61,17 +54,9 @@ def copy_to_clipboard():
     if generated_qr_image is None:
         messagebox.showerror("Error", "No QR code generated yet.")
         return
+    from Library import clipboard
     try:
-        output = io.BytesIO()
-        generated_qr_image.convert("RGB").save(output, "BMP")
-        data = output.getvalue()
-        output.close()
-
-        win32clipboard.OpenClipboard()
-        win32clipboard.EmptyClipboard()
-        win32clipboard.SetClipboardData(win32clipboard.CF_DIB, data[14:])
-        win32clipboard.CloseClipboard()
-
+        clipboard.copy_image(generated_qr_image)
         messagebox.showinfo("Copied", "QR code image copied to clipboard.")
     except Exception as e:
         messagebox.showerror("Error", f"Failed to copy image:\n{e}")
@@ -146,6 +131,11 @@ preview_label.pack()
 
 copy_button = tk.Button(root, text="Copy QR to Clipboard", font=BUTTON_FONT, command=copy_to_clipboard)
 
+def preload():
+    from PIL import Image, ImageTk
+    from Library import clipboard, engine
+
 url_entry.focus()
+root.after_idle(lambda: threading.Thread(target=preload, name="preload", daemon=True).start())
 
 root.mainloop()
@@ -0,0 +1,348 @@
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import PIL
+import qrcode
+from PIL import Image, ImageDraw
+
+from Library import clipboard, engine, layout, raster, verify
+from Library.cache import logo_cache, matrix_cache
+
+# Benchmarks every stage of the render pipeline on its own, across payload
+# sizes, error levels, box sizes and logo on/off, and writes the numbers as
+# JSON so two commits can be compared stage by stage:
+#
+#   python bench.py -o before.json
+#   python bench.py -o after.json --compare before.json
+#
+# --startup measures process start-up instead: import times from
+# python -X importtime and, where a display is available, how long main.py
+# takes to draw its first frame and to finish loading the render stack.
+
+PAYLOAD_SIZES = (16, 256, 1024)
+BOX_SIZES = (4, 10, 40)
+
+# Stages that only depend on the payload and error level
+ENCODE_STAGES = ("qrcode_make", "encode")
+# Stages that also depend on box size and logo
+IMAGE_STAGES = ("rasterize", "convert_rgb", "logo_load", "logo_paste", "preview", "png_save", "dib", "verify", "logo_fit")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# What main.py imports before its window appears, and what preload() adds
+GUI_IMPORTS = "import tkinter, tkinter.ttk, Library.trace, Library.settings, Library.worker"
+RENDER_IMPORTS = "import Library.engine, Library.clipboard, PIL.ImageTk"
+
+
+def payload(length, seed=0):
+    # URL-like byte mode payload of an exact length
+    rng = random.Random(seed + length)
+    return "https://example.com/" + "".join(rng.choice(string.ascii_letters + string.digits) for _ in range(max(0, length - 20)))
+
+
+def make_logo(path):
+    logo = Image.new("RGBA", (512, 512), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(logo)
+    draw.ellipse((16, 16, 496, 496), fill=(220, 40, 40, 255), outline=(255, 255, 255, 255), width=24)
+    logo.save(path)
+    return path
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def measure(function, repeat, warmup=1):
+    """Time repeat calls of function; returns stats with peak traced memory."""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        function()
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+
+    # One more call under tracemalloc, kept out of the timings above
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    total = sum(samples) / 1e9
+    return {
+        "ops_per_sec": round(repeat / total, 2) if total else None,
+        "p50_ms": round(percentile(samples, 0.50) / 1e6, 4),
+        "p99_ms": round(percentile(samples, 0.99) / 1e6, 4),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def encode_stages(data, options):
+    error_correction = engine.ERROR_LEVELS[options["error_level"]]
+
+    def qrcode_make():
+        # The pipeline as it was before the engine: search with fit=True
+        qr = qrcode.QRCode(error_correction=error_correction, box_size=options["box_size"], border=options["border"])
+        qr.add_data(data)
+        qr.make(fit=True)
+
+    return {
+        "qrcode_make": qrcode_make,
+        # Matrix cache bypassed, so this is plan + Reed-Solomon + mask choice
+        "encode": lambda: engine.make_matrix(data, options),
+    }
+
+
+def image_stages(data, options, logo_path):
+    matrix = engine.make_matrix(data, options)
+    qr_px = (matrix.size + 2 * options["border"]) * options["box_size"]
+    palette_img = raster.rasterize(matrix, options, "P")
+    rgb_img = raster.rasterize(matrix, options, "RGB")
+    # What gets saved, copied and verified: the code with its logo, if any
+    code_img = rgb_img
+    if logo_path:
+        logo = engine.place_logo((qr_px, qr_px), logo_path, options["logo_position"])
+        code_img = rgb_img.copy()
+        code_img.paste(logo[0], logo[1], logo[0])
+
+    def preview():
+        # Cold matrix cache, so the preview includes encoding as it does
+        # for every new URL typed into the GUI
+        matrix_cache.clear()
+        engine.render_preview(data, options)
+
+    stages = {
+        "rasterize": lambda: raster.rasterize(matrix, options, "RGB" if logo_path else options["image_mode"]),
+        "convert_rgb": lambda: palette_img.convert("RGB"),
+        "preview": preview,
+        "png_save": lambda: engine.encode_image(code_img, "PNG"),
+        "dib": lambda: clipboard.build_dib(code_img),
+        # Decode the finished code back, as cli.py --verify does per row
+        "verify": lambda: verify.verify_image(code_img, data, options),
+    }
+    if logo_path:
+
+        def logo_load():
+            # Cold: open, decode and thumbnail the file every time
+            logo_cache.clear()
+            engine.place_logo((qr_px, qr_px), logo_path, options["logo_position"])
+
+        def logo_paste():
+            logo_img, position = logo
+            rgb_img.copy().paste(logo_img, position, logo_img)
+
+        def logo_fit():
+            # One encode per error level tried plus the budget check per
+            # placement; the logo itself comes from the warm logo cache
+            matrix_cache.clear()
+            engine.fit_logo(data, dict(options, use_logo=True, logo_path=logo_path))
+
+        stages["logo_load"] = logo_load
+        stages["logo_paste"] = logo_paste
+        stages["logo_fit"] = logo_fit
+    return stages
+
+
+def import_time(code):
+    """Milliseconds python -X importtime reports for the imports in code."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True,
+                            check=True)
+    total = 0
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package", nested imports indented
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total / 1000
+
+
+def time_to_first_frame(timeout=60):
+    """(first frame, render stack loaded) in ms for a fresh main.py, or None without a display."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py")], cwd=ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True, env=dict(os.environ, QRCODE_STARTUP_BENCH="1"))
+    marks = {}
+    try:
+        for line in process.stdout:
+            marks[line.strip()] = (time.perf_counter() - start) * 1000
+            if "engine_ready" in marks:
+                break
+        process.wait(timeout)
+    finally:
+        if process.poll() is None:
+            process.kill()
+    if "engine_ready" not in marks:
+        return None
+    return marks["first_frame"], marks["engine_ready"]
+
+
+def startup_stats(samples):
+    samples = sorted(samples)
+    return {"p50_ms": round(percentile(samples, 0.50), 2), "p99_ms": round(percentile(samples, 0.99), 2), "runs": len(samples)}
+
+
+def run_startup(args, log=sys.stderr):
+    results = []
+
+    def record(stage, samples):
+        results.append(dict(stage=stage, **startup_stats(samples)))
+        print(f"{stage:20} p50 {results[-1]['p50_ms']} ms", file=log)
+
+    # Every run is a fresh interpreter, so module caches never carry over
+    record("import_gui", [import_time(GUI_IMPORTS) for _ in range(args.repeat)])
+    record("import_render", [import_time(RENDER_IMPORTS) for _ in range(args.repeat)])
+
+    launches = [time_to_first_frame() for _ in range(args.repeat)]
+    if None in launches:
+        print("skipping first frame: main.py could not open a window", file=log)
+    else:
+        record("first_frame", [first for first, _ in launches])
+        record("engine_ready", [ready for _, ready in launches])
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, log=sys.stderr):
+    if args.startup:
+        return make_report(args, run_startup(args, log))
+
+    logo_dir = tempfile.TemporaryDirectory()
+    logo_path = args.logo or make_logo(os.path.join(logo_dir.name, "logo.png"))
+    results = []
+
+    def record(stage, stats, **params):
+        results.append(dict(stage=stage, **params, **stats))
+        print(f"{stage:12} {params} {stats['ops_per_sec']} ops/s p50 {stats['p50_ms']} ms", file=log)
+
+    try:
+        for size, level in itertools.product(args.sizes, args.levels):
+            data = payload(size)
+            options = engine.resolve_options(error_level=level)
+            try:
+                engine.plan(data, options)
+            except ValueError:
+                print(f"skipping {size} bytes at {level}: does not fit", file=log)
+                continue
+            for stage, function in encode_stages(data, options).items():
+                if stage in args.stages:
+                    record(stage, measure(function, args.repeat), payload_bytes=size, error_level=level)
+
+            for box_size, use_logo in itertools.product(args.box_sizes, (False, True)):
+                options = engine.resolve_options(error_level=level, box_size=box_size, use_logo=use_logo,
+                                                 logo_path=logo_path if use_logo else None)
+                matrix_cache.clear()
+                for stage, function in image_stages(data, options, logo_path if use_logo else None).items():
+                    if stage in args.stages:
+                        record(stage, measure(function, args.repeat), payload_bytes=size, error_level=level,
+                               box_size=box_size, logo=use_logo)
+    finally:
+        logo_dir.cleanup()
+    return make_report(args, results)
+
+
+def make_report(args, results):
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pillow": PIL.__version__,
+            "qrcode": getattr(qrcode, "__version__", None) or _package_version("qrcode"),
+            "numpy": layout.np.__version__ if layout.np is not None else None,
+            "repeat": args.repeat,
+            # tracemalloc sees Python and numpy allocations, not PIL's own buffers
+            "peak_memory": "tracemalloc",
+        },
+        "results": results,
+    }
+
+
+def _package_version(name):
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception:
+        return None
+
+
+def result_key(result):
+    return tuple((key, result[key]) for key in ("stage", "payload_bytes", "error_level", "box_size", "logo") if key in result)
+
+
+def compare(report, baseline, threshold=0.10):
+    """Lines for every measurement whose p50 moved by more than threshold."""
+    before = {result_key(result): result for result in baseline["results"]}
+    lines = []
+    for result in report["results"]:
+        old = before.get(result_key(result))
+        if old is None or not old["p50_ms"]:
+            continue
+        change = result["p50_ms"] / old["p50_ms"] - 1
+        if abs(change) >= threshold:
+            label = " ".join(f"{key}={value}" for key, value in result_key(result))
+            verdict = "slower" if change > 0 else "faster"
+            lines.append(f"{label}: {old['p50_ms']} -> {result['p50_ms']} ms p50 ({change:+.0%}, {verdict})")
+    return lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the render pipeline and write the results as JSON.")
+    parser.add_argument("-o", "--output", help="JSON file to write (default: stdout)")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per measurement (default: 20)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=PAYLOAD_SIZES, help="payload sizes in bytes")
+    parser.add_argument("--levels", nargs="+", choices=tuple(engine.ERROR_LEVELS), default=tuple(engine.ERROR_LEVELS))
+    parser.add_argument("--box-sizes", type=int, nargs="+", default=BOX_SIZES)
+    parser.add_argument("--stages", nargs="+", choices=ENCODE_STAGES + IMAGE_STAGES, default=ENCODE_STAGES + IMAGE_STAGES)
+    parser.add_argument("--logo", help="logo image to benchmark with (default: a generated 512 px PNG)")
+    parser.add_argument("--compare", help="earlier JSON report; prints every p50 that moved by 10%% or more")
+    parser.add_argument("--quick", action="store_true", help="one size, error level and box size, 5 runs each")
+    parser.add_argument("--startup", action="store_true",
+                        help="measure start-up (import times, main.py time to first frame) instead of render stages")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.quick:
+        args.sizes, args.levels, args.box_sizes, args.repeat = (256,), ("H",), (10,), 5
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            changes = compare(report, json.load(f))
+        print("\n".join(changes) or "No stage moved by 10% or more.", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
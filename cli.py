@@ -0,0 +1,307 @@
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import deque
+from multiprocessing import freeze_support
+
+from Library import engine, imposition, png, trace, vector
+from Library.config import Config, ConfigError
+from Library.parallel import format_stats, render_parallel
+from Library.writers import Manifest, open_writer
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
+
+# Row keys that may override the command line options per code
+ROW_OPTIONS = ("box_size", "border", "error_level", "version", "fill_color", "back_color", "use_logo", "logo_path", "logo_position", "logo_fit")
+
+
+def load_config(path):
+    try:
+        return Config.load(path)
+    except OSError as e:
+        raise ConfigError(f"Could not read {path}: {e}") from e
+
+
+def with_profile(config, overrides):
+    """Row overrides on top of the profile the row names, if it names one."""
+    if "profile" not in overrides:
+        return overrides
+    overrides = dict(overrides)
+    return dict(config.profile(overrides.pop("profile")), **overrides)
+
+
+def detect_input_format(path):
+    lower = path.lower()
+    if lower.endswith(".csv"):
+        return "csv"
+    if lower.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    return "lines"
+
+
+def read_rows(stream, input_format, column):
+    # Yields (data, name, overrides) one row at a time, never the whole file
+    if input_format == "csv":
+        for row in csv.DictReader(stream):
+            yield row.get(column, ""), row.get("name"), {"profile": row["profile"]} if row.get("profile") else {}
+    elif input_format == "jsonl":
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if isinstance(row, str):
+                yield row, None, {}
+            else:
+                overrides = {key: row[key] for key in ROW_OPTIONS + ("profile",) if key in row}
+                yield row.get(column, ""), row.get("name"), overrides
+    else:
+        for line in stream:
+            yield line.rstrip("\r\n"), None, {}
+
+
+def entry_name(index, name, extension):
+    if name:
+        name = re.sub(r"[^\w.-]", "_", str(name)).strip(".")
+    return f"{name or f'{index:06d}'}.{extension}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render one QR code per input row.")
+    parser.add_argument("input", help="CSV, JSONL or text file with one payload per line; - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="output folder, a .zip/.tar/.tar.gz archive, or a multi-page .pdf/.tif file")
+    parser.add_argument("--input-format", choices=("csv", "jsonl", "lines"), help="default: guessed from the file extension")
+    parser.add_argument("--column", default="data", help="CSV/JSONL field holding the payload (default: data)")
+    parser.add_argument("--format", choices=("png", "svg", "pdf"), default="png")
+    parser.add_argument("--image-mode", choices=engine.IMAGE_MODES, default="auto",
+                        help="pixel format of PNG output; auto keeps two-color codes at 1 bit (default: auto)")
+    parser.add_argument("--png-preset", choices=tuple(png.PRESETS), default="default",
+                        help="fastest uses zlib's run-length mode (much quicker on large codes), smallest squeezes hardest")
+    parser.add_argument("--no-metadata", action="store_true", help="write PNGs without optional chunks")
+    parser.add_argument("--config", default=CONFIG_PATH, help="settings file to take defaults from")
+    parser.add_argument("--profile", help="style profile from the settings file (default: the one the GUI uses); rows may name their own")
+    parser.add_argument("--box-size", type=int)
+    parser.add_argument("--border", type=int)
+    parser.add_argument("--error-level", choices=tuple(engine.ERROR_LEVELS))
+    parser.add_argument("--qr-version", type=int, help="pin every code to this symbol version (1-40) so all have the same size")
+    parser.add_argument("--mask", type=int, choices=range(8), metavar="0-7",
+                        help="use this mask pattern instead of scoring all eight (faster, codes still scan)")
+    parser.add_argument("--segments", choices=engine.SEGMENT_MODES, default="auto",
+                        help="optimal mixes numeric/alphanumeric/byte segments for the fewest bits, kanji also uses kanji mode (default: auto)")
+    parser.add_argument("--fill-color")
+    parser.add_argument("--back-color")
+    parser.add_argument("--logo", help="logo image to paste onto every code")
+    parser.add_argument("--logo-position", choices=engine.LOGO_POSITIONS)
+    parser.add_argument("--logo-fit", choices=engine.LOGO_FITS,
+                        help="auto raises the error level, moves the logo to the center or shrinks it until the code stays readable")
+    parser.add_argument("--logo-cache-mb", type=int, help="memory cap for decoded logos per process (default: 64)")
+    parser.add_argument("--matrix-store", help="file that keeps encoded symbols between runs")
+    parser.add_argument("--manifest", choices=("csv", "json"),
+                        help="add an index of row -> entry, version and size (a sidecar file for .pdf/.tif output)")
+    parser.add_argument("--fail-fast", action="store_true", help="stop at the first row that fails")
+    parser.add_argument("--verify", action="store_true",
+                        help="decode every code after rendering; codes that do not read back are reported and not written")
+    parser.add_argument("--verify-damage", type=float, default=0.0, metavar="FRACTION",
+                        help="with --verify, flip this fraction of data modules first to demand some headroom (e.g. 0.01)")
+    parser.add_argument("--workers", type=int, default=1, help="render processes; 0 uses every core (default: 1)")
+    parser.add_argument("--max-in-flight", type=int, help="chunks queued per batch before reading more input (default: 2 per worker)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="rows sent to a worker at a time (default: 16)")
+    parser.add_argument("--stats", action="store_true", help="print per-worker throughput when done")
+    parser.add_argument("--sheet", choices=imposition.SHEETS,
+                        help="tile the codes onto print pages (A4, letter) or label stock instead of one file per code")
+    parser.add_argument("--columns", type=int, default=4, help="codes across an A4/letter page (default: 4)")
+    parser.add_argument("--rows", type=int, default=6, help="codes down an A4/letter page (default: 6)")
+    parser.add_argument("--dpi", type=int, default=300, help="print resolution of sheets (default: 300)")
+    parser.add_argument("--captions", action="store_true", help="print the row name (or the payload) under each code on sheets")
+    return parser.parse_args(argv)
+
+
+def build_options(args, config):
+    options = dict(config.profile(args.profile))
+    for key in ("box_size", "border", "error_level", "fill_color", "back_color", "logo_position", "logo_fit"):
+        value = getattr(args, key)
+        if value is not None:
+            options[key] = value
+    if args.logo:
+        options["use_logo"] = True
+        options["logo_path"] = args.logo
+    options["format"] = args.format
+    options["image_mode"] = args.image_mode
+    options["segments"] = args.segments
+    options["png_preset"] = args.png_preset
+    options["png_metadata"] = not args.no_metadata
+    if args.mask is not None:
+        options["mask"] = args.mask
+    if args.qr_version is not None:
+        options["version"] = args.qr_version
+    if args.matrix_store:
+        options["matrix_store"] = args.matrix_store
+    if args.logo_cache_mb is not None:
+        options["logo_cache_bytes"] = args.logo_cache_mb * 1024 * 1024
+    return engine.resolve_options(options)
+
+
+def open_input(args):
+    input_format = args.input_format or ("lines" if args.input == "-" else detect_input_format(args.input))
+    if args.input == "-":
+        return sys.stdin, input_format
+    return open(args.input, "r", encoding="utf-8", newline="" if input_format == "csv" else None), input_format
+
+
+def run_sheets(args):
+    # Sheets are composited in this process from cached module bitmaps
+    config = load_config(args.config)
+    options = build_options(args, config)
+    sheet = imposition.sheet_layout(args.sheet, args.dpi, args.columns, args.rows)
+    stream, input_format = open_input(args)
+    writer = open_writer(args.output)
+    failed = 0
+    placed = 0
+
+    def rows():
+        nonlocal placed, failed
+        for data, name, overrides in read_rows(stream, input_format, args.column):
+            placed += 1
+            try:
+                overrides = with_profile(config, overrides)
+            except ConfigError as e:
+                failed += 1
+                print(f"Row {placed}: {e}", file=sys.stderr)
+                continue
+            yield data, name, overrides
+
+    def report(item, error):
+        nonlocal failed
+        failed += 1
+        print(f"Row {placed}: {error}", file=sys.stderr)
+
+    pages = 0
+    try:
+        for page in imposition.impose(rows(), options, sheet, captions=args.captions, on_error=report):
+            pages += 1
+            if getattr(writer, "page_format", None) == "pdf":
+                writer.write(f"page-{pages:04d}.pdf", vector.image_pdf_bytes(page, sheet.dpi))
+            else:
+                data = png.png_bytes(page, options["png_preset"], metadata=options["png_metadata"], dpi=sheet.dpi)
+                writer.write(f"page-{pages:04d}.png", data)
+    finally:
+        writer.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    print(f"Wrote {placed - failed} QR codes on {pages} pages to {args.output}" + (f", {failed} failed" if failed else ""), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def run(args):
+    if args.sheet:
+        if args.verify:
+            print("--verify is not supported with --sheet; verify the codes without --sheet first.", file=sys.stderr)
+            return 2
+        return run_sheets(args)
+    config = load_config(args.config)
+    options = build_options(args, config)
+    writer = open_writer(args.output)
+    # Multi-page files decide what each page has to be rendered as
+    page_format = getattr(writer, "page_format", None)
+    if page_format:
+        options = engine.resolve_options(options, format=page_format)
+    extension = page_format or args.format
+    manifest = Manifest(args.manifest, margins=args.verify) if args.manifest else None
+    stream, input_format = open_input(args)
+
+    # Rows wait here while they are rendered; results come back in order
+    pending = deque()
+
+    stats = {}
+    written = failed = 0
+    lowest_margin = None
+
+    def jobs():
+        nonlocal failed
+        for index, (data, name, overrides) in enumerate(read_rows(stream, input_format, args.column), 1):
+            try:
+                overrides = with_profile(config, overrides)
+            except ConfigError as e:
+                # Never reaches the workers, so it is counted here
+                failed += 1
+                print(f"Row {index}: {e}", file=sys.stderr)
+                if args.fail_fast:
+                    return
+                continue
+            pending.append((index, name, data, overrides))
+            yield data, overrides
+
+    start = time.perf_counter()
+    results = render_parallel(
+        jobs(),
+        options,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+        chunk_size=args.chunk_size,
+        return_exceptions=True,
+        stats=stats,
+        verify=args.verify_damage if args.verify else None,
+        info=bool(manifest)
+    )
+    try:
+        for result in results:
+            index, name, data, overrides = pending.popleft()
+            if isinstance(result, Exception):
+                failed += 1
+                print(f"Row {index}: {result}", file=sys.stderr)
+                if args.fail_fast:
+                    break
+                continue
+            verification = info = None
+            if manifest or args.verify:
+                result, info = result
+            if args.verify:
+                verification = info["verification"]
+                if not verification.ok:
+                    failed += 1
+                    print(f"Row {index}: does not scan: {verification.message}", file=sys.stderr)
+                    if args.fail_fast:
+                        break
+                    continue
+                if lowest_margin is None or verification.margin < lowest_margin:
+                    lowest_margin = verification.margin
+            entry = writer.write(entry_name(index, name, extension), result)
+            written += 1
+            if manifest:
+                # The version the worker used; logo_fit="auto" may have raised it
+                manifest.add(index, entry, info["version"], len(result), verification and verification.margin)
+    finally:
+        results.close()
+        if manifest:
+            writer.add_manifest(manifest)
+            manifest.close()
+        writer.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    if args.stats:
+        print(format_stats(stats, time.perf_counter() - start), file=sys.stderr)
+    if lowest_margin is not None:
+        print(f"Every written code decodes; the weakest could lose {lowest_margin} more codewords", file=sys.stderr)
+    print(f"Wrote {written} QR codes to {args.output}" + (f", {failed} failed" if failed else ""), file=sys.stderr)
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    # QRCODE_TRACE=log (or prometheus:<path>) traces rows rendered in this process
+    trace.enable_from_env()
+    try:
+        return run(parse_args(argv))
+    except ConfigError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    freeze_support()
+    sys.exit(main())
@@ -1,168 +1,250 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk
-import qrcode
-import io
-import win32clipboard
-from tkinter import colorchooser
+from tkinter import filedialog, messagebox, ttk
 import os
-import json
+import threading
 
+# The render stack (engine, qrcode, numpy, PIL) is imported on first use or
+# by preload() once the window is up, never before the first frame
+from Library import trace
+from Library.config import Config, ConfigError
 from Library.settings import open_settings_window as settings_window
+from Library.worker import RenderWorker
 
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
 
+# How often the GUI checks for a finished background render
+POLL_MS = 30
+# Quiet time after the last keystroke before the preview is redrawn
+PREVIEW_DELAY_MS = 250
+# Quiet time after the last settings change before config.json is written
+SAVE_DELAY_MS = 500
+
 # Global variables
 generated_qr_image = None
-logo_path = None
-use_logo = False
-fill_color = "black"
-back_color = "white"
-error_level = "H"
-logo_position = "center"
 
 def load_config():
-    global fill_color, back_color, error_level, logo_path, use_logo, logo_position
-    if os.path.isfile(CONFIG_PATH):
-        try:
-            with open(CONFIG_PATH, "r") as f:
-                config = json.load(f)
-                fill_color = config.get("fill_color", "black")
-                back_color = config.get("back_color", "white")
-                error_level = config.get("error_level", "H")
-                logo_path = config.get("logo_path", None)
-                use_logo = config.get("use_logo", False)
-                logo_position = config.get("logo_position", "center")
-        except Exception as e:
-            print("Failed to load config:", e)
-load_config()
+    try:
+        return Config.load(CONFIG_PATH)
+    except (OSError, ConfigError) as e:
+        print("Failed to load config:", e)
+        return Config(path=CONFIG_PATH)
+config = load_config()
+# QRCODE_TRACE=log (or prometheus:<path>) reports where render time goes
+trace.enable_from_env()
+
+save_after_id = None
 
 def save_config():
-    config = {
-        "fill_color": fill_color,
-        "back_color": back_color,
-        "error_level": error_level,
-        "use_logo": use_logo,
-        "logo_position": logo_position,
-        "logo_path": logo_path
-    }
+    global save_after_id
+    save_after_id = None
     try:
-        with open(CONFIG_PATH, "w") as f:
-            json.dump(config, f, indent=2)
-        messagebox.showinfo("Saved", "Settings saved.")
-    except Exception as e:
+        config.save()
+    except OSError as e:
         messagebox.showerror("Error", f"Failed to save settings:\n{e}")
 
+def schedule_save():
+    # Several changes in a row end up as one write
+    global save_after_id
+    if save_after_id is not None:
+        root.after_cancel(save_after_id)
+    save_after_id = root.after(SAVE_DELAY_MS, save_config)
+
 def open_settings_window():
-    def save_config_callback(new_error_level, new_use_logo, new_logo_position, new_logo_path, new_fill_color, new_back_color):
-        global error_level, use_logo, logo_position, logo_path, fill_color, back_color
-        error_level = new_error_level
-        use_logo = new_use_logo
-        logo_position = new_logo_position
-        logo_path = new_logo_path
-        fill_color = new_fill_color
-        back_color = new_back_color
-        save_config()
+    def save_config_callback(name, style):
+        # Keys the window does not edit (box_size, version, ...) stay as they are
+        config.set_profile(name, dict(config.profiles.get(name, {}), **style))
+        config.active = name
+        schedule_save()
+        schedule_preview()
 
     settings_window(
         root=root,
-        fill_color=fill_color,
-        back_color=back_color,
-        error_level=error_level,
-        logo_path=logo_path,
-        use_logo=use_logo,
-        logo_position=logo_position,
+        profiles=config.profiles,
+        active=config.active,
         save_config_callback=save_config_callback
     )
 
-def generate_qr():
-    global generated_qr_image
+generated_key = None
+preview_after_id = None
 
+def read_request(show_errors=True):
     url = url_entry.get().strip()
     if not url:
-        messagebox.showerror("Error", "Please enter a URL.")
-        return
+        if show_errors:
+            messagebox.showerror("Error", "Please enter a URL.")
+        return None
 
     try:
         box_size = int(box_size_entry.get())
         border = int(border_entry.get())
     except ValueError:
-        messagebox.showerror("Error", "Box size and border must be integers.")
+        if show_errors:
+            messagebox.showerror("Error", "Box size and border must be integers.")
+        return None
+
+    # Profiles can opt out with "logo_fit": "off"; check_scan still catches the rest
+    options = dict({"logo_fit": "auto"}, **config.profile())
+    # The entries win over a profile's box_size and border
+    options.update(box_size=box_size, border=border)
+    return url, options
+
+def request_key(url, options):
+    return url, tuple(sorted(options.items()))
+
+def schedule_preview(event=None):
+    # Debounce typing: only render once input has been still for a moment
+    global preview_after_id
+    if preview_after_id is not None:
+        root.after_cancel(preview_after_id)
+    preview_after_id = root.after(PREVIEW_DELAY_MS, update_preview)
+
+def update_preview():
+    global preview_after_id
+    preview_after_id = None
+    request = read_request(show_errors=False)
+    if request is None:
+        preview_worker.cancel()
+        preview_label.config(image="", text="QR Code Preview")
+        preview_label.image = None
         return
+    preview_worker.submit(*request)
+
+def render_preview(url, options, on_logo_error=None):
+    from Library import engine
+    return engine.render_preview(url, options, on_logo_error)
+
+def check_scan(output, url, options):
+    # A logo can hide more modules than the error correction level recovers
+    from Library import engine, verify
+    options = engine.resolve_options(options)
+    if options["use_logo"] and verify.np is not None:
+        with trace.stage("verify"):
+            result = verify.verify_output(output, url, options)
+        if not result.ok:
+            raise ValueError(f"The logo makes this code unreadable ({result.message}). "
+                             "Use a higher error correction level or another logo position.")
+
+def export_qr(job, options, on_logo_error=None):
+    # Runs on the export worker thread; the full-size render only happens here
+    from Library import engine, png
+    url, save_path = job
+    if save_path is None:
+        qr_img = engine.render(url, options, on_logo_error)
+        check_scan(qr_img, url, options)
+        return qr_img
+    extension = os.path.splitext(save_path)[1].lstrip(".").upper()
+    if extension in engine.VECTOR_FORMATS:
+        # Vector files are written from the module matrix, no raster at all
+        data = engine.render(url, dict(options, format=extension), on_logo_error)
+        check_scan(data, url, dict(options, format=extension))
+        with open(save_path, "wb") as f:
+            f.write(data)
+        return None
+    qr_img = engine.render(url, options, on_logo_error)
+    check_scan(qr_img, url, options)
+    with trace.stage("save", path=save_path):
+        if extension == "PNG":
+            # Two-color codes go out as 1 bit PNGs, not 24 bit RGB
+            png.save_png(qr_img, save_path, options.get("png_preset", "default"))
+        else:
+            qr_img.save(save_path)
+    return qr_img
+
+# Previews: only the newest matters. Exports: every save and copy must run.
+preview_worker = RenderWorker(render=render_preview)
+export_worker = RenderWorker(render=export_qr, latest_only=False)
+
+def set_busy(busy):
+    if busy:
+        progress_bar.pack(pady=(0, 5), fill="x")
+        progress_bar.start(10)
+        root.config(cursor="watch")
+    else:
+        progress_bar.stop()
+        progress_bar.pack_forget()
+        root.config(cursor="")
 
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction={
-            "L": qrcode.constants.ERROR_CORRECT_L,
-            "M": qrcode.constants.ERROR_CORRECT_M,
-            "Q": qrcode.constants.ERROR_CORRECT_Q,
-            "H": qrcode.constants.ERROR_CORRECT_H
-        }[error_level],
-        box_size=box_size,
-        border=border
-    )
-    qr.add_data(url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color=fill_color, back_color=back_color).convert("RGB")
-
-    if use_logo and logo_path and os.path.isfile(logo_path):
-        try:
-            logo = Image.open(logo_path).convert("RGBA")
-            qr_width, qr_height = qr_img.size
-            logo_size = int(qr_width * 0.2)
-            logo.thumbnail((logo_size, logo_size), Image.LANCZOS)
-
-            positions = {
-                "center": ((qr_width - logo.width) // 2, (qr_height - logo.height) // 2),
-                "top-left": (0, 0),
-                "top-right": (qr_width - logo.width, 0),
-                "bottom-left": (0, qr_height - logo.height),
-                "bottom-right": (qr_width - logo.width, qr_height - logo.height),
-            }
-            xpos, ypos = positions.get(logo_position, positions["center"])
-            qr_img.paste(logo, (xpos, ypos), logo)
-        except Exception as e:
-            messagebox.showwarning("Logo Error", f"Could not add logo:\n{e}")
-
-    generated_qr_image = qr_img
-    qr_display_img = qr_img.copy()
-    qr_display_img.thumbnail((200, 200), Image.LANCZOS)
-    qr_photo = ImageTk.PhotoImage(qr_display_img)
-
-    preview_label.config(image=qr_photo, text="")
-    preview_label.image = qr_photo
-
-    if not copy_button.winfo_ismapped():
-        copy_button.pack(pady=10)
+def generate_qr():
+    request = read_request()
+    if request is None:
+        return
+    url, options = request
 
     save_path = filedialog.asksaveasfilename(
         defaultextension=".png",
-        filetypes=[("PNG files", "*.png")],
+        filetypes=[("PNG files", "*.png"), ("SVG files", "*.svg"), ("PDF files", "*.pdf")],
         title="Save QR Code As"
     )
     if save_path:
-        generated_qr_image.save(save_path)
-        messagebox.showinfo("Success", f"QR code saved to:\n{save_path}")
+        export_worker.submit((url, save_path), options)
+        set_busy(True)
 
 def copy_to_clipboard():
-    if generated_qr_image is None:
-        messagebox.showerror("Error", "No QR code generated yet.")
+    request = read_request()
+    if request is None:
         return
-    try:
-        output = io.BytesIO()
-        generated_qr_image.convert("RGB").save(output, "BMP")
-        data = output.getvalue()
-        output.close()
+    url, options = request
 
-        win32clipboard.OpenClipboard()
-        win32clipboard.EmptyClipboard()
-        win32clipboard.SetClipboardData(win32clipboard.CF_DIB, data[14:])
-        win32clipboard.CloseClipboard()
+    if generated_qr_image is not None and generated_key == request_key(url, options):
+        copy_image(generated_qr_image)
+    else:
+        export_worker.submit((url, None), options)
+        set_busy(True)
 
+def copy_image(qr_img):
+    from Library import clipboard
+    try:
+        clipboard.copy_image(qr_img)
         messagebox.showinfo("Copied", "QR code image copied to clipboard.")
     except Exception as e:
         messagebox.showerror("Error", f"Failed to copy image:\n{e}")
 
+def poll_workers():
+    result = preview_worker.poll()
+    if result is not None:
+        show_preview(result)
+
+    result = export_worker.poll()
+    if result is not None:
+        if not export_worker.busy:
+            set_busy(False)
+        finish_export(result)
+
+    root.after(POLL_MS, poll_workers)
+
+def show_preview(result):
+    if result.error is not None:
+        preview_label.config(image="", text="QR Code Preview")
+        preview_label.image = None
+        return
+
+    from PIL import ImageTk
+    qr_photo = ImageTk.PhotoImage(result.image)
+    preview_label.config(image=qr_photo, text="")
+    preview_label.image = qr_photo
+
+    if not copy_button.winfo_ismapped():
+        copy_button.pack(pady=10)
+
+def finish_export(result):
+    global generated_qr_image, generated_key
+
+    url, save_path = result.data
+    if result.error is not None:
+        messagebox.showerror("Error", f"Failed to generate QR code:\n{result.error}")
+        return
+    for e in result.logo_errors:
+        messagebox.showwarning("Logo Error", f"Could not add logo:\n{e}")
+
+    if result.image is not None:
+        generated_qr_image = result.image
+        generated_key = request_key(url, result.options)
+
+    if save_path is None:
+        copy_image(result.image)
+    else:
+        messagebox.showinfo("Success", f"QR code saved to:\n{save_path}")
+
 # GUI setup
 root = tk.Tk()
 root.title("QR Code Generator")
@@ -210,9 +292,14 @@ border_entry = tk.Entry(settings_row, font=("Helvetica", 10), width=10)
 border_entry.insert(0, "4")
 border_entry.grid(row=1, column=1, padx=5)
 
+for entry in (url_entry, box_size_entry, border_entry):
+    entry.bind("<KeyRelease>", schedule_preview)
+
 tk.Button(frame, text="Settings", font=BUTTON_FONT, command=open_settings_window).pack(pady=5, ipady=2)
 tk.Button(frame, text="Generate & Save QR Code", font=BUTTON_FONT, command=generate_qr).pack(pady=10, ipady=5)
 
+progress_bar = ttk.Progressbar(frame, mode="indeterminate")
+
 preview_frame = tk.Frame(root, height=220, width=220)
 preview_frame.pack(pady=10)
 preview_frame.pack_propagate(False)
@@ -222,5 +309,38 @@ preview_label.pack()
 
 copy_button = tk.Button(root, text="Copy QR to Clipboard", font=BUTTON_FONT, command=copy_to_clipboard)
 
+preloaded = threading.Event()
+
+def preload():
+    # Import the render stack while the user is still typing the first URL
+    from Library import clipboard, engine, png
+    from PIL import ImageTk
+    preloaded.set()
+
+def on_first_frame():
+    threading.Thread(target=preload, name="preload", daemon=True).start()
+    if os.environ.get("QRCODE_STARTUP_BENCH"):
+        # bench.py --startup times how long these lines take to appear
+        root.update_idletasks()
+        print("first_frame", flush=True)
+        wait_for_preload()
+
+def on_close():
+    # Write settings that are still waiting for their debounce
+    if save_after_id is not None:
+        root.after_cancel(save_after_id)
+        save_config()
+    root.destroy()
+
+def wait_for_preload():
+    if not preloaded.is_set():
+        root.after(5, wait_for_preload)
+        return
+    print("engine_ready", flush=True)
+    root.destroy()
+
 url_entry.focus()
+root.after(POLL_MS, poll_workers)
+root.after_idle(on_first_frame)
+root.protocol("WM_DELETE_WINDOW", on_close)
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,253 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from Library import engine, layout, raster, trace
+from Library.cache import ResponseCache, SingleFlight, logo_cache, matrix_cache
+from cli import CONFIG_PATH, load_config
+
+# Local HTTP rendering service:
+#   GET /qr?data=...&box=10&border=4&ec=M&fmt=png|svg|pdf&profile=name
+# Finished responses sit in an LRU in front of the engine, identical
+# requests that arrive together share one render, and every response
+# carries an ETag derived from its settings so clients can revalidate
+# without anything being rendered.
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+}
+
+# Query parameter -> engine option
+QUERY_OPTIONS = {
+    "box": "box_size",
+    "border": "border",
+    "ec": "error_level",
+    "fill": "fill_color",
+    "back": "back_color",
+}
+
+# Keep a single request from asking for a gigantic image
+MAX_BOX_SIZE = 100
+MAX_BORDER = 20
+MAX_DATA_LENGTH = 4296
+# Width of the finished code in pixels, quiet zone included
+MAX_IMAGE_PX = 4096
+
+
+class QRService:
+    def __init__(self, options=None, cache_bytes=32 * 1024 * 1024, max_age=86400, profiles=None):
+        self.options = engine.resolve_options(options)
+        # Style profiles a request can pick with ?profile=, applied over
+        # options like the CLI applies a row's profile, validated up front
+        self.profiles = {name: engine.resolve_options(self.options, **profile) for name, profile in (profiles or {}).items()}
+        self.max_age = max_age
+        self.responses = ResponseCache(cache_bytes)
+        self.flights = SingleFlight()
+
+    def parse(self, query):
+        """(data, options, fmt) for a query string; ValueError if invalid."""
+        params = {key: values[-1] for key, values in parse_qs(query, keep_blank_values=True).items()}
+        data = params.get("data", "")
+        if not data:
+            raise ValueError("Missing data parameter.")
+        if len(data) > MAX_DATA_LENGTH:
+            raise ValueError(f"data is longer than {MAX_DATA_LENGTH} characters.")
+        fmt = params.get("fmt", "png").lower()
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"Unknown fmt: {fmt!r}")
+
+        base = self.options
+        if params.get("profile"):
+            base = self.profiles.get(params["profile"])
+            if base is None:
+                raise ValueError(f"Unknown profile: {params['profile']!r}")
+
+        overrides = {QUERY_OPTIONS[key]: value for key, value in params.items() if key in QUERY_OPTIONS}
+        if "ec" in params:
+            overrides["error_level"] = params["ec"].upper()
+        if fmt == "png":
+            # Two-color codes go out as 1 bit or palette PNGs, not 24 bit RGB
+            overrides["image_mode"] = "auto"
+        options = engine.resolve_options(base, format=fmt.upper(), **overrides)
+        # SVG would write any string into the markup, so check colors for every format
+        raster.to_rgb(options["fill_color"])
+        raster.to_rgb(options["back_color"])
+        if options["box_size"] > MAX_BOX_SIZE or options["border"] > MAX_BORDER:
+            raise ValueError(f"box must be at most {MAX_BOX_SIZE} and border at most {MAX_BORDER}.")
+        self.check_size(data, options)
+        return data, options, fmt
+
+    @staticmethod
+    def check_size(data, options):
+        """ValueError if the code would be wider than MAX_IMAGE_PX."""
+        planned = options
+        if options["use_logo"] and options["logo_fit"] == "auto":
+            # The fit may raise the error level, and with it the version
+            planned = dict(options, error_level="H")
+        try:
+            _, version, _ = engine.plan(data, planned)
+        except ValueError:
+            # Too long for H (or a pinned version at H); the fit stops below H too
+            _, version, _ = engine.plan(data, options)
+        px = (layout.size_for(version) + 2 * options["border"]) * options["box_size"]
+        if px > MAX_IMAGE_PX:
+            raise ValueError(f"The code would be {px} px wide, more than {MAX_IMAGE_PX}; use a smaller box.")
+
+    @staticmethod
+    def cache_key(data, options):
+        # Everything that changes the response bytes, including the logo
+        # file itself, keyed on mtime and size like the logo cache
+        logo = None
+        if options["use_logo"] and options["logo_path"]:
+            try:
+                info = os.stat(options["logo_path"])
+                logo = (info.st_mtime_ns, info.st_size)
+            except OSError:
+                pass
+        return (data, logo) + tuple(sorted((key, str(value)) for key, value in options.items()))
+
+    @staticmethod
+    def etag(key):
+        return '"' + hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+    def respond(self, data, options, fmt):
+        """(body, content type) for a request, rendered at most once per key."""
+        key = self.cache_key(data, options)
+        response = self.responses.get(key)
+        if response is not None:
+            return response
+
+        def render():
+            body = engine.render(data, options)
+            self.responses.put(key, body, CONTENT_TYPES[fmt])
+            return body, CONTENT_TYPES[fmt]
+
+        return self.flights.do(key, render)
+
+    def stats(self):
+        return {
+            "responses": len(self.responses),
+            "response_bytes": self.responses.used_bytes,
+            "response_hits": self.responses.hits,
+            "response_misses": self.responses.misses,
+            "coalesced": self.flights.coalesced,
+            "matrix_hits": matrix_cache.hits,
+            "matrix_misses": matrix_cache.misses,
+            "logo_hits": logo_cache.hits,
+            "logo_misses": logo_cache.misses,
+        }
+
+
+class QRRequestHandler(BaseHTTPRequestHandler):
+    service = None
+    server_version = "QRCodeService/1.0"
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics" and self.server.metrics is not None:
+            self.send_body(HTTPStatus.OK, self.server.metrics.render().encode("utf-8"), "text/plain; version=0.0.4")
+            return
+        if url.path == "/stats":
+            self.send_body(HTTPStatus.OK, json.dumps(self.service.stats()).encode("utf-8"), "application/json")
+            return
+        if url.path != "/qr":
+            self.send_body(HTTPStatus.NOT_FOUND, b"Not found\n", "text/plain")
+            return
+
+        try:
+            data, options, fmt = self.service.parse(url.query)
+        except ValueError as e:
+            self.send_body(HTTPStatus.BAD_REQUEST, f"{e}\n".encode("utf-8"), "text/plain")
+            return
+
+        etag = self.service.etag(self.service.cache_key(data, options))
+        headers = {"ETag": etag, "Cache-Control": f"public, max-age={self.service.max_age}"}
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_body(HTTPStatus.NOT_MODIFIED, b"", None, headers)
+            return
+
+        try:
+            body, content_type = self.service.respond(data, options, fmt)
+        except (ValueError, engine.LogoError) as e:
+            self.send_body(HTTPStatus.BAD_REQUEST, f"{e}\n".encode("utf-8"), "text/plain")
+            return
+        self.send_body(HTTPStatus.OK, body, content_type, headers)
+
+    do_HEAD = do_GET
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8080, options=None, cache_bytes=32 * 1024 * 1024, max_age=86400, quiet=False,
+                metrics=False, profiles=None):
+    handler = type("Handler", (QRRequestHandler,), {"service": QRService(options, cache_bytes, max_age, profiles)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.quiet = quiet
+    # Per-stage render timings, served from /metrics
+    server.metrics = None
+    if metrics:
+        server.metrics = trace.PrometheusSink()
+        if trace.tracer is None:
+            trace.enable()
+        trace.tracer.sinks.append(server.metrics)
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve QR codes over HTTP: GET /qr?data=...&box=&border=&ec=&fmt=png|svg|pdf")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--config", default=CONFIG_PATH, help="settings file to take defaults from")
+    parser.add_argument("--profile", help="style profile used when a request names none (default: the one the GUI uses)")
+    parser.add_argument("--cache-mb", type=int, default=32, help="memory for cached responses (default: 32)")
+    parser.add_argument("--max-age", type=int, default=86400, help="Cache-Control max-age in seconds (default: 86400)")
+    parser.add_argument("--quiet", action="store_true", help="do not log every request")
+    parser.add_argument("--metrics", action="store_true", help="time every render stage and serve the numbers at /metrics")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    trace.enable_from_env()
+    try:
+        config = load_config(args.config)
+        server = make_server(args.host, args.port, config.profile(args.profile), args.cache_mb * 1024 * 1024, args.max_age,
+                             args.quiet, args.metrics, config.profiles)
+    except ValueError as e:
+        # Also a ConfigError for a malformed file or unknown --profile
+        print(f"Invalid settings: {e}", file=sys.stderr)
+        return 2
+    print(f"Serving QR codes on http://{args.host}:{server.server_address[1]}/qr", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())